@@ -1,14 +1,16 @@
 import time
+from datetime import date
 from functools import lru_cache, update_wrapper
 from math import floor
 from typing import Any, Callable
 
 
-def ttl_cache(maxsize: int = 128, typed: bool = False, ttl: int = -1):
+def ttl_cache(maxsize: int = 128, typed: bool = False, ttl: int = -1, per_day: bool = False):
+	"""With per_day, cached values also expire at local midnight, independent of when the TTL window started."""
 	if ttl <= 0:
 		ttl = 65536
 
-	hash_gen = _ttl_hash_gen(ttl)
+	start_time = time.time()
 
 	def wrapper(func: Callable) -> Callable:
 		@lru_cache(maxsize, typed)
@@ -16,16 +18,15 @@ def ttl_cache(maxsize: int = 128, typed: bool = False, ttl: int = -1):
 			return func(*args, **kwargs)
 
 		def wrapped(*args, **kwargs) -> Any:
-			th = next(hash_gen)
+			th = (_ttl_hash(start_time, ttl), date.today()) if per_day else _ttl_hash(start_time, ttl)
 			return ttl_func(th, *args, **kwargs)
 
+		wrapped.cache_clear = ttl_func.cache_clear
 		return update_wrapper(wrapped, func)
 
 	return wrapper
 
 
-def _ttl_hash_gen(seconds: int):
-	start_time = time.time()
-
-	while True:
-		yield floor((time.time() - start_time) / seconds)
+def _ttl_hash(start_time: float, seconds: int) -> int:
+	# computed on every call instead of kept in a generator, so threads can call the cached function concurrently
+	return floor((time.time() - start_time) / seconds)
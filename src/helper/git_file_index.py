@@ -0,0 +1,110 @@
+import threading
+
+import git
+from quarter_lib.logging import setup_logging
+
+from src.helper.storage_helper import connect
+
+logger = setup_logging(__file__)
+
+INDEX_FILE = "git_file_index.sqlite3"
+# keep non-ASCII paths (umlauts) unquoted in the log output
+LOG_ENV = {"GIT_CONFIG_COUNT": "1", "GIT_CONFIG_KEY_0": "core.quotePath", "GIT_CONFIG_VALUE_0": "false"}
+# exact renames are found from the blob SHAs in the trees; similar ones would make the blobless mirror fetch blobs
+RENAMES = "-M100%"
+# only the branch's own history, with merges diffed against their first parent, so changes made in a merge
+# (or on a merged branch) show up once, when they reached the branch
+HISTORY = ["--first-parent", "--diff-merges=first-parent"]
+
+
+def _apply_log(files, log):
+	"""Applies `git log --reverse --name-status -M100% --first-parent --format=%x00%ct` output to path -> [created, last_modified]."""
+	committed_date = None
+	for line in log.splitlines():
+		if line.startswith("\x00"):
+			committed_date = int(line[1:])
+			continue
+		if not line:
+			continue
+		status, *paths = line.split("\t")
+		if status.startswith("R"):
+			old_path, new_path = paths
+			created_date = files.pop(old_path, [committed_date])[0]
+			files[new_path] = [created_date, committed_date]
+		elif status == "D":
+			files.pop(paths[0], None)
+		elif status.startswith("C") or status == "A":
+			files[paths[-1]] = [committed_date, committed_date]
+		elif paths[-1] in files:
+			files[paths[-1]][1] = committed_date
+		else:
+			files[paths[-1]] = [committed_date, committed_date]
+
+
+class GitFileIndex:
+	"""
+	Created and last modified commit time of every file of a GitMirror branch, stored in SQLite.
+
+	The index remembers the commit it was built for and only reads the log of newer commits; exact renames keep
+	the created date of the old path and deleted files are dropped.
+	"""
+
+	def __init__(self, mirror, file_name=INDEX_FILE):
+		self._mirror = mirror
+		self._file_name = file_name
+		self._lock = threading.Lock()
+		with connect(self._file_name) as connection:
+			connection.execute(
+				"CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, created_date INTEGER NOT NULL, last_modified_date INTEGER NOT NULL)"
+			)
+			connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+	def _is_ancestor(self, head, sha):
+		try:
+			self._mirror.repo.git.merge_base("--is-ancestor", head, sha)
+			return True
+		except git.GitCommandError:
+			return False
+
+	def update(self, sha) -> int:
+		"""Brings the index to commit `sha`; history rewrites trigger a full rebuild."""
+		with self._lock:
+			with connect(self._file_name) as connection:
+				row = connection.execute("SELECT value FROM state WHERE key = 'head'").fetchone()
+				head = row[0] if row else None
+				if head == sha:
+					return 0
+				files = {
+					path: [created_date, last_modified_date]
+					for path, created_date, last_modified_date in connection.execute(
+						"SELECT path, created_date, last_modified_date FROM files"
+					)
+				}
+			full_rebuild = head is None or not self._is_ancestor(head, sha)
+			if full_rebuild:
+				files = {}
+			log = self._mirror.repo.git.log(
+				"--reverse", "--name-status", RENAMES, *HISTORY, "--format=%x00%ct", sha if full_rebuild else f"{head}..{sha}", env=LOG_ENV
+			)
+			_apply_log(files, log)
+			with connect(self._file_name) as connection:
+				connection.execute("DELETE FROM files")
+				connection.executemany(
+					"INSERT INTO files (path, created_date, last_modified_date) VALUES (?, ?, ?)",
+					[(path, dates[0], dates[1]) for path, dates in files.items()],
+				)
+				connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('head', ?)", (sha,))
+			logger.info(f"{'rebuilt' if full_rebuild else 'updated'} file index at {sha}: {len(files)} files")
+			return len(files)
+
+	def get_files(self, prefix, suffix=".md") -> list[dict]:
+		prefix = prefix.strip("/") + "/"
+		with connect(self._file_name) as connection:
+			rows = connection.execute(
+				"SELECT path, created_date, last_modified_date FROM files WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+			).fetchall()
+		return [
+			{"path": path, "created_date": created_date, "last_modified_date": last_modified_date}
+			for path, created_date, last_modified_date in rows
+			if path.endswith(suffix)
+		]
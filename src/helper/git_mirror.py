@@ -0,0 +1,75 @@
+import base64
+import fcntl
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+import git
+from quarter_lib.logging import setup_logging
+
+from src.helper.storage_helper import get_data_path
+
+logger = setup_logging(__file__)
+
+GIT_ENV = {"GIT_TERMINAL_PROMPT": "0"}
+
+
+class GitMirror:
+	"""
+	Long-lived bare, blobless clone of a repository in the data directory.
+
+	The first use clones the repository without file contents, every later use only fetches the branch. Callers
+	read from the commit SHA returned by `update`, so concurrent callers never share a working tree and a fetch
+	never changes what an earlier caller is reading. The token is sent as a header with every command and never
+	written to the clone's config.
+	"""
+
+	def __init__(self, url, directory_name, branch="main", token=None):
+		self._url = url
+		self._env = dict(GIT_ENV)
+		if token:
+			credentials = base64.b64encode(f"x-access-token:{token}".encode()).decode()
+			self._env.update(
+				{
+					"GIT_CONFIG_COUNT": "1",
+					"GIT_CONFIG_KEY_0": "http.extraHeader",
+					"GIT_CONFIG_VALUE_0": f"Authorization: Basic {credentials}",
+				}
+			)
+		self._path = get_data_path(directory_name)
+		self._branch = branch
+		self._lock = threading.Lock()
+
+	@contextmanager
+	def _locked(self):
+		# the file lock keeps other worker processes out, the thread lock other threads of this one
+		with self._lock, open(self._path + ".lock", "w") as lock_file:
+			fcntl.flock(lock_file, fcntl.LOCK_EX)
+			try:
+				yield
+			finally:
+				fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+	def _clone(self):
+		temp_path = self._path + ".tmp"
+		shutil.rmtree(temp_path, ignore_errors=True)
+		logger.info(f"cloning mirror to {self._path}")
+		git.Repo.clone_from(self._url, temp_path, env=self._env, bare=True, filter="blob:none", branch=self._branch)
+		os.rename(temp_path, self._path)
+
+	@property
+	def repo(self) -> git.Repo:
+		return git.Repo(self._path)
+
+	def update(self) -> str:
+		"""Brings the mirror up to date and returns the commit SHA of the branch."""
+		with self._locked():
+			if not os.path.exists(os.path.join(self._path, "HEAD")):
+				self._clone()
+			else:
+				repo = self.repo
+				# also replaces URLs with credentials that older versions stored in the config
+				repo.git.remote("set-url", "origin", self._url)
+				repo.git.fetch("origin", f"+refs/heads/{self._branch}:refs/heads/{self._branch}", env=self._env)
+			return self.repo.git.rev_parse(self._branch)
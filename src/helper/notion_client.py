@@ -0,0 +1,146 @@
+import asyncio
+import threading
+
+import httpx
+from quarter_lib.logging import setup_logging
+
+from src.helper.rate_limiter import AsyncTokenBucket
+
+logger = setup_logging(__file__)
+
+BASE_URL = "https://api.notion.com/v1/"
+NOTION_VERSION = "2021-08-16"
+
+# Notion allows an average of three requests per second per integration
+REQUESTS_PER_SECOND = 3
+MAX_CONCURRENCY = 3
+MAX_RETRIES = 5
+RETRY_STATUS_CODES = {409, 429, 500, 502, 503, 504}
+TIMEOUT_SECONDS = 60
+
+
+def get_retry_delay(response: httpx.Response | None, attempt: int) -> float:
+	if response is not None:
+		retry_after = response.headers.get("Retry-After")
+		if retry_after:
+			try:
+				return float(retry_after)
+			except ValueError:
+				pass
+	return min(2**attempt, 30)
+
+
+class NotionClient:
+	"""
+	Pooled Notion client shared by all Notion calls of the process.
+
+	Requests run on one event loop in a background thread, so the synchronous services and the async routes
+	share the same connection pool, token bucket and concurrency limit.
+	"""
+
+	def __init__(
+		self,
+		token: str,
+		rate: float = REQUESTS_PER_SECOND,
+		max_concurrency: int = MAX_CONCURRENCY,
+		max_retries: int = MAX_RETRIES,
+	):
+		self._headers = {
+			"Authorization": "Bearer " + token,
+			"Content-Type": "application/json",
+			"Notion-Version": NOTION_VERSION,
+		}
+		self._rate = rate
+		self._max_concurrency = max_concurrency
+		self._max_retries = max_retries
+		self._loop = None
+		self._loop_lock = threading.Lock()
+		self._client = None
+		self._bucket = None
+		self._semaphore = None
+
+	def _get_loop(self) -> asyncio.AbstractEventLoop:
+		with self._loop_lock:
+			if self._loop is None:
+				loop = asyncio.new_event_loop()
+				threading.Thread(target=loop.run_forever, name="notion-client", daemon=True).start()
+				self._loop = loop
+		return self._loop
+
+	def _get_client(self) -> httpx.AsyncClient:
+		# only called on the client loop, so no locking is needed
+		if self._client is None:
+			self._client = httpx.AsyncClient(
+				base_url=BASE_URL,
+				headers=self._headers,
+				timeout=TIMEOUT_SECONDS,
+				limits=httpx.Limits(max_connections=self._max_concurrency, max_keepalive_connections=self._max_concurrency),
+			)
+			self._bucket = AsyncTokenBucket(self._rate)
+			self._semaphore = asyncio.Semaphore(self._max_concurrency)
+		return self._client
+
+	async def request(self, method: str, path: str, json: dict | None = None, params=None) -> httpx.Response:
+		client = self._get_client()
+		for attempt in range(self._max_retries + 1):
+			response = None
+			async with self._semaphore:
+				await self._bucket.acquire()
+				try:
+					response = await client.request(method, path, json=json, params=params)
+				except httpx.TransportError as e:
+					if attempt == self._max_retries:
+						raise
+					logger.warning(f"{method} {path} failed with {e.__class__.__name__}: {e}")
+			if response is not None and (response.status_code not in RETRY_STATUS_CODES or attempt == self._max_retries):
+				return response
+			delay = get_retry_delay(response, attempt)
+			if response is not None:
+				logger.warning(f"{method} {path} returned {response.status_code} - retrying in {delay}s")
+				if response.status_code == 429:
+					self._bucket.pause(delay)
+			await asyncio.sleep(delay)
+		return response
+
+	async def iter_database(self, database_id: str, body: dict | None = None, params=None):
+		"""Yield the result pages of a database query one response at a time."""
+		body = dict(body or {})
+		while True:
+			response = await self.request("POST", "databases/" + database_id + "/query", json=body, params=params)
+			response.raise_for_status()
+			r = response.json()
+			yield r["results"]
+			if not r["has_more"]:
+				break
+			body["start_cursor"] = r["next_cursor"]
+
+	async def query_database(self, database_id: str, body: dict | None = None, params=None) -> list[dict]:
+		result_list = []
+		async for results in self.iter_database(database_id, body, params):
+			result_list.extend(results)
+		return result_list
+
+	async def create_page(self, data: dict) -> httpx.Response:
+		return await self.request("POST", "pages", json=data)
+
+	async def update_page(self, page_id: str, properties: dict) -> httpx.Response:
+		return await self.request("PATCH", "pages/" + page_id, json={"properties": properties})
+
+	def run(self, coro):
+		"""Run a coroutine on the client loop and block until it is done."""
+		return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+
+	def run_all(self, coros) -> list:
+		"""Run coroutines concurrently on the client loop; the rate limit is shared between them."""
+		return self.run(gather(coros))
+
+	async def run_async(self, coro):
+		"""Await a coroutine on the client loop from another event loop."""
+		return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._get_loop()))
+
+	async def run_all_async(self, coros) -> list:
+		return await self.run_async(gather(coros))
+
+
+async def gather(coros) -> list:
+	return list(await asyncio.gather(*coros))
@@ -0,0 +1,90 @@
+import pandas as pd
+
+PAGE_COLUMNS = ["id", "created_time", "last_edited_time", "url"]
+PREFIX = "properties~"
+
+
+def _plain_value(property_type):
+	return lambda value: value.get(property_type) if value else None
+
+
+def _name_value(property_type):
+	def extract(value):
+		option = value.get(property_type) if value else None
+		return option["name"] if option else None
+
+	return extract
+
+
+def _list_value(property_type):
+	return lambda value: (value.get(property_type) or []) if value else []
+
+
+# property type -> list of (column suffix, extractor, dtype); the suffixes match pd.json_normalize(sep="~")
+PROPERTY_COLUMNS = {
+	"title": [("title", _list_value("title"), "object")],
+	"rich_text": [("rich_text", _list_value("rich_text"), "object")],
+	"multi_select": [("multi_select", _list_value("multi_select"), "object")],
+	"people": [("people", _list_value("people"), "object")],
+	"relation": [("relation", _list_value("relation"), "object")],
+	"files": [("files", _list_value("files"), "object")],
+	"number": [("number", _plain_value("number"), "float64")],
+	"checkbox": [("checkbox", lambda value: bool(value.get("checkbox")) if value else False, "bool")],
+	"select": [("select~name", _name_value("select"), "object")],
+	"status": [("status~name", _name_value("status"), "object")],
+	"date": [
+		("date~start", lambda value: value["date"]["start"] if value and value.get("date") else None, "object"),
+		("date~end", lambda value: value["date"]["end"] if value and value.get("date") else None, "object"),
+	],
+	"url": [("url", _plain_value("url"), "object")],
+	"email": [("email", _plain_value("email"), "object")],
+	"phone_number": [("phone_number", _plain_value("phone_number"), "object")],
+	"created_time": [("created_time", _plain_value("created_time"), "object")],
+	"last_edited_time": [("last_edited_time", _plain_value("last_edited_time"), "object")],
+}
+
+FORMULA_DTYPES = {"string": "object", "number": "float64", "boolean": "bool", "date": "object"}
+
+
+def _get_formula_columns(name, pages):
+	# the result type of a formula is not part of the schema, so it is read from the values; without any value
+	# there is a column for every result type
+	result_types = {page["properties"][name]["formula"]["type"] for page in pages if page["properties"].get(name)} or set(FORMULA_DTYPES)
+	columns = {}
+	for result_type in sorted(result_types):
+		values = []
+		for page in pages:
+			formula = (page["properties"].get(name) or {}).get("formula") or {}
+			value = formula.get(result_type) if formula.get("type") == result_type else None
+			if result_type == "date":
+				value = value["start"] if value else None
+			values.append(value)
+		if result_type == "date":
+			columns[f"{PREFIX}{name}~formula~date~start"] = pd.Series(values, dtype="object")
+		elif result_type == "boolean":
+			columns[f"{PREFIX}{name}~formula~boolean"] = pd.Series([bool(value) for value in values], dtype="bool")
+		else:
+			columns[f"{PREFIX}{name}~formula~{result_type}"] = pd.Series(values, dtype=FORMULA_DTYPES.get(result_type, "object"))
+	return columns
+
+
+def pages_to_frame(pages, schema, properties=None):
+	"""
+	Builds a DataFrame from Notion pages with one typed column per requested property value.
+
+	Column names follow pd.json_normalize(pages, sep="~") (e.g. "properties~Priority~number"), but only the
+	values callers read are extracted and every column exists even if no page has a value. A formula gets a
+	column per result type found in the pages, or one for every result type if no page has a value. Properties
+	of unknown type keep their raw value under "properties~<name>~<type>".
+	"""
+	names = [name for name in (properties if properties is not None else schema.keys()) if name in schema]
+	columns = {column: pd.Series([page.get(column) for page in pages], dtype="object") for column in PAGE_COLUMNS}
+	for name in names:
+		property_type = schema[name]["type"]
+		if property_type == "formula":
+			columns.update(_get_formula_columns(name, pages))
+			continue
+		for suffix, extract, dtype in PROPERTY_COLUMNS.get(property_type, [(property_type, _plain_value(property_type), "object")]):
+			values = [extract(page["properties"].get(name)) for page in pages]
+			columns[f"{PREFIX}{name}~{suffix}"] = pd.Series(values, dtype=dtype)
+	return pd.DataFrame(columns)
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from quarter_lib.logging import setup_logging
+
+from src.helper.storage_helper import connect
+
+logger = setup_logging(__file__)
+
+MIRROR_FILE = "notion_mirror.sqlite3"
+# a periodic full refresh re-downloads every page, e.g. after properties were added to the database
+FULL_REFRESH_INTERVAL = timedelta(hours=int(os.environ.get("NOTION_MIRROR_FULL_REFRESH_HOURS", 24 * 7)))
+
+# queries never return archived or deleted pages, so the page ids of a database are compared with the mirror
+# on this interval; pages archived by this process are dropped right away by store_page
+PAGE_SWEEP_INTERVAL = timedelta(hours=int(os.environ.get("NOTION_MIRROR_SWEEP_HOURS", 24)))
+
+# only the title property is returned, so listing which pages a database still has stays cheap
+PAGE_IDS_PARAMS = {"filter_properties": "title"}
+
+
+class NotionMirror:
+	"""
+	Local SQLite copy of Notion databases.
+
+	A refresh only downloads the pages edited since the stored high-water mark. Archived and deleted pages are
+	dropped by a sweep over the page ids every PAGE_SWEEP_INTERVAL and by the periodic full refresh.
+	"""
+
+	def __init__(self, client, file_name=MIRROR_FILE):
+		self._client = client
+		self._file_name = file_name
+		self._locks = {}
+		self._refreshed_at = {}
+		with connect(self._file_name) as connection:
+			connection.execute(
+				"""CREATE TABLE IF NOT EXISTS pages (
+					database_id TEXT NOT NULL,
+					page_id TEXT NOT NULL,
+					last_edited_time TEXT NOT NULL,
+					payload TEXT NOT NULL,
+					PRIMARY KEY (database_id, page_id)
+				)"""
+			)
+			connection.execute(
+				"""CREATE TABLE IF NOT EXISTS databases (
+					database_id TEXT PRIMARY KEY,
+					high_water_mark TEXT,
+					last_full_refresh TEXT NOT NULL,
+					last_sweep TEXT
+				)"""
+			)
+			if "last_sweep" not in {row[1] for row in connection.execute("PRAGMA table_info(databases)")}:
+				connection.execute("ALTER TABLE databases ADD COLUMN last_sweep TEXT")
+
+	def _get_state(self, database_id):
+		with connect(self._file_name) as connection:
+			return connection.execute(
+				"SELECT high_water_mark, last_full_refresh, last_sweep FROM databases WHERE database_id = ?", (database_id,)
+			).fetchone()
+
+	def _store(self, database_id, pages, full_refresh, page_ids=None) -> int:
+		now = datetime.now(timezone.utc).isoformat()
+		removed = 0
+		with connect(self._file_name) as connection:
+			if full_refresh:
+				connection.execute("DELETE FROM pages WHERE database_id = ?", (database_id,))
+			elif page_ids is not None:
+				stored_ids = {row[0] for row in connection.execute("SELECT page_id FROM pages WHERE database_id = ?", (database_id,))}
+				missing_ids = stored_ids - page_ids - {page["id"] for page in pages}
+				connection.executemany(
+					"DELETE FROM pages WHERE database_id = ? AND page_id = ?", [(database_id, page_id) for page_id in missing_ids]
+				)
+				removed = len(missing_ids)
+			connection.executemany(
+				"INSERT OR REPLACE INTO pages (database_id, page_id, last_edited_time, payload) VALUES (?, ?, ?, ?)",
+				[(database_id, page["id"], page["last_edited_time"], json.dumps(page)) for page in pages],
+			)
+			high_water_mark = connection.execute(
+				"SELECT MAX(last_edited_time) FROM pages WHERE database_id = ?", (database_id,)
+			).fetchone()[0]
+			if full_refresh:
+				connection.execute(
+					"INSERT OR REPLACE INTO databases (database_id, high_water_mark, last_full_refresh, last_sweep) VALUES (?, ?, ?, ?)",
+					(database_id, high_water_mark, now, now),
+				)
+			else:
+				connection.execute("UPDATE databases SET high_water_mark = ? WHERE database_id = ?", (high_water_mark, database_id))
+				if page_ids is not None:
+					connection.execute("UPDATE databases SET last_sweep = ? WHERE database_id = ?", (now, database_id))
+		return removed
+
+	async def _get_changed_pages(self, database_id, high_water_mark):
+		# last_edited_time is rounded to the minute, so pages at the mark are fetched again
+		body = {"filter": {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": high_water_mark}}}
+		return await self._client.query_database(database_id, body)
+
+	async def _get_page_ids(self, database_id):
+		page_ids = set()
+		async for results in self._client.iter_database(database_id, params=PAGE_IDS_PARAMS):
+			page_ids.update(page["id"] for page in results)
+		return page_ids
+
+	async def refresh(self, database_id, max_age=0) -> int:
+		lock = self._locks.setdefault(database_id, asyncio.Lock())
+		async with lock:
+			if max_age and time.monotonic() - self._refreshed_at.get(database_id, float("-inf")) < max_age:
+				return 0
+			state = self._get_state(database_id)
+			full_refresh = (
+				state is None or state[0] is None or datetime.now(timezone.utc) - datetime.fromisoformat(state[1]) > FULL_REFRESH_INTERVAL
+			)
+			sweep = not full_refresh and (
+				state[2] is None or datetime.now(timezone.utc) - datetime.fromisoformat(state[2]) > PAGE_SWEEP_INTERVAL
+			)
+			page_ids = None
+			if full_refresh:
+				pages = await self._client.query_database(database_id)
+			elif sweep:
+				pages, page_ids = await asyncio.gather(self._get_changed_pages(database_id, state[0]), self._get_page_ids(database_id))
+			else:
+				pages = await self._get_changed_pages(database_id, state[0])
+			removed = self._store(database_id, pages, full_refresh, page_ids)
+			self._refreshed_at[database_id] = time.monotonic()
+			logger.info(
+				f"refreshed mirror of {database_id} ({'full' if full_refresh else 'incremental'}): {len(pages)} pages fetched, {removed} removed"
+			)
+			return len(pages)
+
+	def store_page(self, database_id, page):
+		"""Write-through for pages changed by this process; the high-water mark stays untouched."""
+		if self._get_state(database_id) is None:
+			return
+		with connect(self._file_name) as connection:
+			if page.get("archived") or page.get("in_trash"):
+				connection.execute("DELETE FROM pages WHERE database_id = ? AND page_id = ?", (database_id, page["id"]))
+				return
+			connection.execute(
+				"INSERT OR REPLACE INTO pages (database_id, page_id, last_edited_time, payload) VALUES (?, ?, ?, ?)",
+				(database_id, page["id"], page["last_edited_time"], json.dumps(page)),
+			)
+
+	def get_pages(self, database_id) -> list[dict]:
+		with connect(self._file_name) as connection:
+			rows = connection.execute("SELECT payload FROM pages WHERE database_id = ?", (database_id,)).fetchall()
+		return [json.loads(row[0]) for row in rows]
@@ -0,0 +1,71 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Condition:
+	property: str
+	operator: str
+	value: object = True
+
+
+def equals(property_name, value):
+	return Condition(property_name, "equals", value)
+
+
+def greater_than(property_name, value):
+	return Condition(property_name, "greater_than", value)
+
+
+def is_empty(property_name):
+	return Condition(property_name, "is_empty")
+
+
+def is_not_empty(property_name):
+	return Condition(property_name, "is_not_empty")
+
+
+def _get_formula_type(value):
+	if isinstance(value, bool):
+		return "checkbox"
+	if isinstance(value, (int, float)):
+		return "number"
+	return "string"
+
+
+def build_filter(conditions, schema):
+	"""
+	Turns conditions into a Notion `filter` body. The filter type of every property is taken from the
+	database schema; a condition on a property the database does not have raises a ValueError, so a renamed
+	property never turns into an unfiltered query.
+	"""
+	parts = []
+	for condition in conditions:
+		if condition.property not in schema:
+			raise ValueError(f"property '{condition.property}' not in database - cannot filter on it")
+		property_type = schema[condition.property]["type"]
+		if property_type == "formula":
+			parts.append(
+				{"property": condition.property, "formula": {_get_formula_type(condition.value): {condition.operator: condition.value}}}
+			)
+		else:
+			parts.append({"property": condition.property, property_type: {condition.operator: condition.value}})
+	if not parts:
+		return None
+	return {"and": parts}
+
+
+def build_filter_properties(properties, schema):
+	"""Query parameters which limit the returned page properties to `properties` (by property id)."""
+	return [("filter_properties", schema[name]["id"]) for name in properties if name in schema]
+
+
+def build_query(schema, conditions=None, properties=None):
+	body = {}
+	params = None
+	if conditions:
+		query_filter = build_filter(conditions, schema)
+		if query_filter:
+			body["filter"] = query_filter
+	if properties:
+		params = build_filter_properties(properties, schema)
+	return body, params
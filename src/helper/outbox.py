@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from quarter_lib.logging import setup_logging
+
+from src.helper.storage_helper import connect
+
+logger = setup_logging(__file__)
+
+OUTBOX_FILE = "outbox.sqlite3"
+MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 5))
+MAX_RETRY_DELAY = timedelta(hours=1)
+# done entries are kept a while so that re-planned side effects are recognised
+DONE_RETENTION = timedelta(days=7)
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+def _now():
+	return datetime.now(timezone.utc)
+
+
+class Outbox:
+	"""
+	Write-ahead log of side effects in a SQLite file of the data directory.
+
+	Every entry has a unique key; adding a key which is pending or done keeps the existing entry and only failed
+	entries are planned again, so a routine can re-plan the same work without repeating side effects that already
+	happened. An entry can depend on another one and is only sent after that one is done. Entries are sent in batches by the handler registered for their kind; a handler returns one error
+	(or None) per entry. Failed entries are retried with backoff until MAX_ATTEMPTS is reached.
+	"""
+
+	def __init__(self, file_name=OUTBOX_FILE):
+		self._file_name = file_name
+		self._handlers = {}
+		self._drain_lock = threading.Lock()
+		with connect(self._file_name) as connection:
+			connection.execute(
+				"""CREATE TABLE IF NOT EXISTS entries (
+					id INTEGER PRIMARY KEY AUTOINCREMENT,
+					key TEXT NOT NULL UNIQUE,
+					kind TEXT NOT NULL,
+					group_key TEXT,
+					depends_on TEXT,
+					payload TEXT NOT NULL,
+					status TEXT NOT NULL,
+					attempts INTEGER NOT NULL DEFAULT 0,
+					last_error TEXT,
+					next_attempt_at TEXT NOT NULL,
+					updated_at TEXT NOT NULL
+				)"""
+			)
+			connection.execute("CREATE INDEX IF NOT EXISTS entries_status ON entries (status, kind)")
+			connection.execute("CREATE INDEX IF NOT EXISTS entries_group_key ON entries (group_key)")
+
+	def register(self, kind, handler, batch_size=100):
+		self._handlers[kind] = (handler, batch_size)
+
+	def add(self, kind, key, payload, group_key=None, depends_on=None) -> int:
+		return self.add_all([(kind, key, payload, group_key, depends_on)])
+
+	def add_all(self, entries) -> int:
+		"""Records (kind, key, payload, group_key, depends_on) entries in one transaction; returns how many were queued."""
+		now = _now().isoformat()
+		with connect(self._file_name) as connection:
+			cursor = connection.executemany(
+				"""INSERT INTO entries (key, kind, group_key, depends_on, payload, status, next_attempt_at, updated_at)
+				VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+				ON CONFLICT (key) DO UPDATE SET
+					payload = excluded.payload,
+					group_key = excluded.group_key,
+					depends_on = excluded.depends_on,
+					status = excluded.status,
+					attempts = 0,
+					last_error = NULL,
+					next_attempt_at = excluded.next_attempt_at,
+					updated_at = excluded.updated_at
+				WHERE entries.status = ?""",
+				[
+					(key, kind, group_key, depends_on, json.dumps(payload), PENDING, now, now, FAILED)
+					for kind, key, payload, group_key, depends_on in entries
+				],
+			)
+			return cursor.rowcount
+
+	def get_pending_groups(self, group_keys) -> set:
+		group_keys = list(group_keys)
+		if not group_keys:
+			return set()
+		with connect(self._file_name) as connection:
+			rows = connection.execute(
+				f"SELECT DISTINCT group_key FROM entries WHERE status = ? AND group_key IN ({', '.join('?' for _ in group_keys)})",
+				[PENDING, *group_keys],
+			).fetchall()
+		return {row[0] for row in rows}
+
+	def _fail_orphans(self, connection, now):
+		connection.execute(
+			"""UPDATE entries SET status = ?, last_error = 'dependency failed', updated_at = ?
+			WHERE status = ? AND depends_on IN (SELECT key FROM entries WHERE status = ?)""",
+			(FAILED, now, PENDING, FAILED),
+		)
+
+	def _get_ready(self, kind, limit):
+		now = _now().isoformat()
+		with connect(self._file_name) as connection:
+			self._fail_orphans(connection, now)
+			return connection.execute(
+				"""SELECT e.key, e.payload, e.attempts FROM entries e
+				LEFT JOIN entries d ON d.key = e.depends_on
+				WHERE e.kind = ? AND e.status = ? AND e.next_attempt_at <= ?
+					AND (e.depends_on IS NULL OR d.key IS NULL OR d.status = ?)
+				ORDER BY e.id LIMIT ?""",
+				(kind, PENDING, now, DONE, limit),
+			).fetchall()
+
+	def _store_results(self, rows, errors):
+		now = _now()
+		updates = []
+		for (key, _, attempts), error in zip(rows, errors):
+			if error is None:
+				updates.append((DONE, attempts + 1, None, now.isoformat(), now.isoformat(), key))
+				continue
+			status = FAILED if attempts + 1 >= MAX_ATTEMPTS else PENDING
+			delay = min(timedelta(seconds=30 * 2**attempts), MAX_RETRY_DELAY)
+			logger.error(f"outbox entry {key} failed ({attempts + 1}/{MAX_ATTEMPTS}): {error}")
+			updates.append((status, attempts + 1, str(error), (now + delay).isoformat(), now.isoformat(), key))
+		with connect(self._file_name) as connection:
+			connection.executemany(
+				"UPDATE entries SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?, updated_at = ? WHERE key = ?",
+				updates,
+			)
+
+	def _drain_kind(self, kind, handler, batch_size) -> int:
+		sent = 0
+		while True:
+			rows = self._get_ready(kind, batch_size)
+			if not rows:
+				return sent
+			try:
+				errors = handler([json.loads(row[1]) for row in rows])
+			except Exception as e:
+				errors = [e] * len(rows)
+			# failed entries wait for their backoff, so they are not picked up again in this drain
+			self._store_results(rows, errors)
+			sent += sum(error is None for error in errors)
+			if len(rows) < batch_size:
+				return sent
+
+	def drain(self) -> dict:
+		"""Sends every ready entry; kinds are drained in registration order, so dependencies settle in one pass."""
+		with self._drain_lock:
+			result = {kind: self._drain_kind(kind, handler, batch_size) for kind, (handler, batch_size) in self._handlers.items()}
+			with connect(self._file_name) as connection:
+				connection.execute("DELETE FROM entries WHERE status = ? AND updated_at < ?", (DONE, (_now() - DONE_RETENTION).isoformat()))
+		if any(result.values()):
+			logger.info(f"outbox drained: {result}")
+		return result
@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+
+class AsyncTokenBucket:
+	"""Token bucket for asyncio code: `rate` tokens per second, bursts of up to `capacity`."""
+
+	def __init__(self, rate: float, capacity: float | None = None):
+		self.rate = rate
+		self.capacity = capacity if capacity is not None else rate
+		self._tokens = self.capacity
+		self._updated_at = time.monotonic()
+		self._blocked_until = 0.0
+		self._lock = asyncio.Lock()
+
+	def _refill(self, now: float) -> None:
+		self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+		self._updated_at = now
+
+	async def acquire(self) -> None:
+		async with self._lock:
+			while True:
+				now = time.monotonic()
+				if now < self._blocked_until:
+					await asyncio.sleep(self._blocked_until - now)
+					continue
+				self._refill(now)
+				if self._tokens >= 1:
+					self._tokens -= 1
+					return
+				await asyncio.sleep((1 - self._tokens) / self.rate)
+
+	def pause(self, seconds: float) -> None:
+		"""Hold back every caller for `seconds`, e.g. after the server answered with Retry-After."""
+		self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+		self._tokens = 0
+		self._updated_at = self._blocked_until
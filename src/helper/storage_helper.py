@@ -0,0 +1,29 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+DATA_DIR = os.environ.get("DATA_DIR", os.path.join(os.getcwd(), "data"))
+# set in the deployment: the outbox and the mirrors must survive a redeploy
+REQUIRE_PERSISTENT_DATA_DIR = os.environ.get("REQUIRE_PERSISTENT_DATA_DIR", "False") == "True"
+
+
+def check_data_dir():
+	if REQUIRE_PERSISTENT_DATA_DIR and not os.path.ismount(DATA_DIR):
+		raise Exception(f"DATA_DIR {DATA_DIR} is not a mounted volume - pending outbox entries would be lost on the next redeploy")
+
+
+def get_data_path(file_name):
+	os.makedirs(DATA_DIR, exist_ok=True)
+	return os.path.join(DATA_DIR, file_name)
+
+
+@contextmanager
+def connect(file_name):
+	"""SQLite connection to a file in the data directory; commits on success and is always closed."""
+	connection = sqlite3.connect(get_data_path(file_name), timeout=30)
+	try:
+		connection.execute("PRAGMA journal_mode=WAL")
+		with connection:
+			yield connection
+	finally:
+		connection.close()
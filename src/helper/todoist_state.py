@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from quarter_lib.logging import setup_logging
+from todoist_api_python.models import Project, Section, Task
+
+from src.helper.storage_helper import connect
+
+logger = setup_logging(__file__)
+
+SYNC_URL = "https://api.todoist.com/api/v1/sync"
+RESOURCE_TYPES = ["items", "projects", "sections"]
+STATE_FILE = "todoist_state.sqlite3"
+FULL_SYNC_TOKEN = "*"
+TIMEOUT_SECONDS = 60
+
+
+def _is_active(resource_type, resource):
+	if resource.get("is_deleted"):
+		return False
+	if resource_type == "items":
+		return not resource.get("checked")
+	if resource_type in ("projects", "sections"):
+		return not resource.get("is_archived")
+	return True
+
+
+class TodoistState:
+	"""
+	In-process copy of the Todoist items, projects and sections, kept up to date with the Sync API.
+
+	The sync_token and the resources are stored in the data directory, so after the first full sync a sync
+	only downloads what changed since the previous one. Items are indexed by label, project and section.
+	"""
+
+	def __init__(self, token, file_name=STATE_FILE):
+		self._headers = {"Authorization": "Bearer " + token}
+		self._file_name = file_name
+		self._lock = threading.RLock()
+		self._synced_at = float("-inf")
+		self._resources = {resource_type: {} for resource_type in RESOURCE_TYPES}
+		self._indexes = {key: defaultdict(set) for key in ("labels", "project_id", "section_id")}
+		with connect(self._file_name) as connection:
+			connection.execute(
+				"""CREATE TABLE IF NOT EXISTS resources (
+					resource_type TEXT NOT NULL,
+					id TEXT NOT NULL,
+					payload TEXT NOT NULL,
+					PRIMARY KEY (resource_type, id)
+				)"""
+			)
+			connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+			row = connection.execute("SELECT value FROM state WHERE key = 'sync_token'").fetchone()
+			rows = connection.execute("SELECT resource_type, payload FROM resources").fetchall()
+		self._sync_token = row[0] if row else FULL_SYNC_TOKEN
+		for resource_type, payload in rows:
+			if resource_type in self._resources:
+				self._apply(resource_type, json.loads(payload))
+
+	def _index_item(self, item, add):
+		keys = {"labels": item.get("labels") or [], "project_id": [item.get("project_id")], "section_id": [item.get("section_id")]}
+		for index_name, values in keys.items():
+			for value in values:
+				if value is None:
+					continue
+				if add:
+					self._indexes[index_name][value].add(item["id"])
+				else:
+					self._indexes[index_name][value].discard(item["id"])
+
+	def _apply(self, resource_type, resource):
+		resources = self._resources[resource_type]
+		previous = resources.pop(resource["id"], None)
+		if resource_type == "items" and previous is not None:
+			self._index_item(previous, add=False)
+		if not _is_active(resource_type, resource):
+			return
+		resources[resource["id"]] = resource
+		if resource_type == "items":
+			self._index_item(resource, add=True)
+
+	def _reset(self):
+		for resources in self._resources.values():
+			resources.clear()
+		for index in self._indexes.values():
+			index.clear()
+
+	def _store(self, changes, full_sync, sync_token):
+		with connect(self._file_name) as connection:
+			if full_sync:
+				connection.execute("DELETE FROM resources")
+			for resource_type, resources in changes.items():
+				connection.executemany(
+					"INSERT OR REPLACE INTO resources (resource_type, id, payload) VALUES (?, ?, ?)",
+					[
+						(resource_type, resource["id"], json.dumps(resource))
+						for resource in resources
+						if _is_active(resource_type, resource)
+					],
+				)
+				connection.executemany(
+					"DELETE FROM resources WHERE resource_type = ? AND id = ?",
+					[(resource_type, resource["id"]) for resource in resources if not _is_active(resource_type, resource)],
+				)
+			connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('sync_token', ?)", (sync_token,))
+
+	def _request(self):
+		data = {"sync_token": self._sync_token, "resource_types": json.dumps(RESOURCE_TYPES)}
+		response = requests.post(SYNC_URL, headers=self._headers, data=data, timeout=TIMEOUT_SECONDS)
+		if response.status_code == 400 and self._sync_token != FULL_SYNC_TOKEN:
+			logger.warning(f"incremental sync rejected ({response.text}) - falling back to a full sync")
+			self._sync_token = FULL_SYNC_TOKEN
+			return self._request()
+		response.raise_for_status()
+		return response.json()
+
+	def sync(self, max_age=0) -> int:
+		"""Apply the changes since the last sync; skipped if the last sync is younger than `max_age` seconds."""
+		with self._lock:
+			if max_age and time.monotonic() - self._synced_at < max_age:
+				return 0
+			r = self._request()
+			full_sync = r.get("full_sync", False)
+			if full_sync:
+				self._reset()
+			changes = {resource_type: r.get(resource_type) or [] for resource_type in RESOURCE_TYPES}
+			for resource_type, resources in changes.items():
+				for resource in resources:
+					self._apply(resource_type, resource)
+			self._store(changes, full_sync, r["sync_token"])
+			self._sync_token = r["sync_token"]
+			self._synced_at = time.monotonic()
+			changed = sum(len(resources) for resources in changes.values())
+			logger.info(f"todoist sync ({'full' if full_sync else 'incremental'}): {changed} changed resources")
+			return changed
+
+	def get_raw_items(self, label=None, project_id=None, section_id=None) -> list[dict]:
+		with self._lock:
+			items = self._resources["items"]
+			ids = None
+			for index_name, value in (("labels", label), ("project_id", project_id), ("section_id", section_id)):
+				if value is None:
+					continue
+				matches = self._indexes[index_name].get(value, set())
+				ids = matches if ids is None else ids & matches
+			selected = list(items.values()) if ids is None else [items[item_id] for item_id in ids]
+		return sorted(selected, key=lambda item: (item.get("project_id") or "", item.get("child_order") or 0))
+
+	def count_items(self, project_id) -> int:
+		with self._lock:
+			return len(self._indexes["project_id"].get(project_id, ()))
+
+	def get_items(self, label=None, project_id=None, section_id=None) -> list[Task]:
+		return [Task.from_dict(item) for item in self.get_raw_items(label, project_id, section_id)]
+
+	def get_raw_projects(self) -> list[dict]:
+		with self._lock:
+			projects = list(self._resources["projects"].values())
+		return sorted(projects, key=lambda project: project.get("child_order") or 0)
+
+	def get_projects(self) -> list[Project]:
+		return [Project.from_dict(project) for project in self.get_raw_projects()]
+
+	def get_sections(self, project_id=None) -> list[Section]:
+		with self._lock:
+			sections = [
+				section for section in self._resources["sections"].values() if project_id is None or section.get("project_id") == project_id
+			]
+		return [Section.from_dict(section) for section in sorted(sections, key=lambda section: section.get("section_order") or 0)]
@@ -5,13 +5,12 @@ from datetime import datetime, timedelta
 from fastapi import APIRouter
 from loguru import logger
 
+from src.services.book_note_service import get_book_rework_items
 from src.services.github_service import get_files, get_files_with_modification_date
 from src.services.todoist_service import (
 	add_obsidian_task_for_activity,
 	add_obsidian_task_for_note,
 	check_if_last_item,
-	get_items_by_todoist_project,
-	get_rework_projects,
 	update_task_due,
   	get_vacation_mode,
 )
@@ -103,27 +102,7 @@ def update_book_rework_unweighted():
 def update_book_rework(weighted):
 	logger.info("start - daily update book rework")
 
-	rework_projects = get_rework_projects()
-
-	items = []
-	for project in rework_projects:
-		items.extend(get_items_by_todoist_project(project.id))
-
-	items = [{"orig_item": item} for item in items]
-	for item in items:
-		content = item["orig_item"].content
-		split_content = content.split(" - ")
-		if len(split_content) != 3:
-			if split_content[len(split_content) - 1] == "Obsidian-Eintrag überdenken":
-				item["annotation"] = "".join(split_content[0 : len(split_content) - 2])
-				item["book"] = split_content[len(split_content) - 2]
-			else:
-				logger.error(f"item with content '{content}' has no book")
-		else:
-			item["annotation"] = split_content[0]
-			item["book"] = split_content[1]
-
-	items = [item for item in items if "book" in item.keys()]
+	items = get_book_rework_items()
 	# order by orig_item.created
 	items = sorted(items, key=lambda x: x["orig_item"].created_at, reverse=True)
 
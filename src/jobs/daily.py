@@ -25,19 +25,20 @@ from src.services.monica_service import (
 )
 from src.services.notion_service import (
 	DATABASES,
+	NOTION_CLIENT,
 	get_article_database,
 	get_page_for_date,
 	get_random_from_notion_link_list,
-	get_text_from_article,
+	iter_texts_from_articles,
 	stretch_article_list,
 	stretch_project_tasks,
 	update_habit_tracker_vacation_mode,
 	update_notion_habit_tracker,
-	update_notion_page_checkbox,
+	update_notion_page_checkbox_async,
 	stretch_databases, fill_freezer_db,
 )
 from src.services.sqlite_service import get_koreader_book, get_koreader_page_stat
-from src.services.todoist_service import TODOIST_API, add_after_vacation_tasks, get_vacation_mode
+from src.services.todoist_service import TODOIST_API, add_after_vacation_tasks, clear_user_state_cache, get_vacation_mode
 from src.services.tts_service import transcribe
 
 logger = setup_logging(__file__)
@@ -131,6 +132,14 @@ def vacation_mode_checker():
 	logger.info("end - daily vacation mode checker")
 
 
+@logger.catch
+@router.post("/clear_user_state_cache")
+def clear_user_state_cache_route():
+	logger.info("clear cached Todoist user state")
+	clear_user_state_cache()
+	return {"status": "ok"}
+
+
 @logger.catch
 @router.post("/notion_habit_tracker_stack")
 def notion_habit_tracker_stack():
@@ -149,17 +158,21 @@ def notion_habit_tracker_stack():
 def stretch_tpt():
 	logger.info("start daily - stretch tpt")
 	database_id = "b3042bf44bd14f40b0167764a0107c2f"
-	stretch_project_tasks(database_id)
+	result = stretch_project_tasks(database_id)
 	logger.info("end daily - stretch tpt")
+	return result
 
 
 @logger.catch
 @router.post("/stretch_lists")
 def stretch_lists():
 	logger.info("start daily - stretch lists")
-	stretch_databases("ccf13accb1124856b6092fd37614144b")
-	stretch_databases("28fbb871dc8d8115ac91e92570ba7790")
+	result = {
+		"ccf13accb1124856b6092fd37614144b": stretch_databases("ccf13accb1124856b6092fd37614144b"),
+		"28fbb871dc8d8115ac91e92570ba7790": stretch_databases("28fbb871dc8d8115ac91e92570ba7790"),
+	}
 	logger.info("end daily - stretch lists")
+	return result
 
 
 @logger.catch
@@ -167,16 +180,18 @@ def stretch_lists():
 def stretch_mm():
 	logger.info("start daily - stretch mm")
 	database_id = "4e5cc9cbbaf741ddbb4b38ac919ae1f1"
-	stretch_project_tasks(database_id)
+	result = stretch_project_tasks(database_id)
 	logger.info("end daily - stretch mm")
+	return result
 
 
 @logger.catch
 @router.post("/stretch_articles")
 def stretch_articles():
 	logger.info("start daily - stretch articles")
-	stretch_article_list()
+	result = stretch_article_list()
 	logger.info("end daily - stretch articles")
+	return result
 
 @logger.catch
 @router.post("/fill_freezer_db")
@@ -237,19 +252,21 @@ def update_koreader_statistics():
 async def article_to_audio_routine():
 	logger.info("start article to audio")
 	db = get_article_database()
-	for _, row in db.iterrows():
+	async for row, text, error in iter_texts_from_articles(db):
+		title = row["properties~Name~title"][0]["plain_text"]
 		try:
-			text = get_text_from_article(row)
+			if error:
+				raise error
 			if text:
 				language = row["properties~Language~select~name"]
-				filename = slugify(row["properties~Name~title"][0]["plain_text"]) + ".mp3"
+				filename = slugify(title) + ".mp3"
 				await transcribe(text, language, filename)
 				upload_transcribed_article_to_onedrive(filename, row["properties~Website~formula~string"])
-				update_notion_page_checkbox(row["id"], "Transcribed-And-Uploaded-To-OneDrive", True)
+				await NOTION_CLIENT.run_async(update_notion_page_checkbox_async(row["id"], "Transcribed-And-Uploaded-To-OneDrive", True))
 			else:
-				logger.warning(f'no text for {row["properties~Name~title"][0]["plain_text"]}')
+				logger.warning(f"no text for {title}")
 		except Exception as e:
-			logger.error(f"error for {row['title']}: {e}")
+			logger.error(f"error for {title}: {e}")
 
 
 def umlaut_sort_key(word):
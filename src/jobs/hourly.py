@@ -1,25 +1,24 @@
+import asyncio
+
 from fastapi import APIRouter
 from quarter_lib.logging import setup_logging
 
 from src.helper.config_helper import get_value
-from src.services.github_service import add_to_work_inbox
 from src.services.monica_database_service import (
 	add_to_be_deleted_activities_to_obsidian,
 	get_inbox_activities_to_clean,
 )
 from src.services.notion_service import (
 	DATABASES,
-	add_task_to_notion_database,
 	WISHLIST_ID,
 )
-from src.services.obsidian_service import add_to_obsidian_microjournal
+from src.services.outbox_service import drain_outbox, plan_microjournal, plan_notion_tasks, plan_work_inbox
 from src.services.todoist_service import (
-	complete_task,
+	MICROJOURNAL_DONE_SECTION_ID,
+	TO_WORK_DONE_SECTION_ID,
+	TPT_DONE_SECTION_ID,
 	get_items_by_todoist_label,
-	move_item_to_microjournal_done,
-	move_item_to_notion_done,
-	move_item_to_work_done,
-	set_done_label,
+	get_items_by_todoist_labels,
 )
 
 logger = setup_logging(__file__)
@@ -48,18 +47,82 @@ TO_MICROJOURNAL_LABEL_NAME = "To-Microjournal"
 TO_WORK_LABEL_NAME = "To-Work"
 
 
+# the sinks only queue their side effects in the outbox, the drainer started in main.py sends them
+def route_to_tpt(list_to_move):
+	tech_database = get_value("tech", "name", DATABASES)["id"]
+	return plan_notion_tasks("tpt", tech_database, list_to_move, "TPT", TPT_DONE_SECTION_ID, complete=True)
+
+
+def route_to_microjournal(list_to_move):
+	# add_to_monica_microjournal(list_to_move)
+	return plan_microjournal("microjournal", list_to_move, "Microjournal", MICROJOURNAL_DONE_SECTION_ID)
+
+
+def route_to_work(list_to_move):
+	return plan_work_inbox("work", list_to_move, "Work", TO_WORK_DONE_SECTION_ID)
+
+
+def route_to_mm(list_to_move):
+	mm_database = get_value("mindfull_mastery", "name", DATABASES)["id"]
+	return plan_notion_tasks("mm", mm_database, list_to_move, "MM", TPT_DONE_SECTION_ID)
+
+
+def route_to_wishlist(list_to_move):
+	return plan_notion_tasks("wishlist", WISHLIST_ID, list_to_move, complete=True, priority=-1)
+
+
+# label -> (sink name, sink)
+SINKS = {
+	TO_TPT_LABEL_NAME: ("tpt", route_to_tpt),
+	TO_MM_LABEL_NAME: ("mm", route_to_mm),
+	TO_WISHLIST_LABEL_NAME: ("wishlist", route_to_wishlist),
+	TO_WORK_LABEL_NAME: ("work", route_to_work),
+	TO_MICROJOURNAL_LABEL_NAME: ("microjournal", route_to_microjournal),
+}
+
+
+def run_sink(sink_name, sink, list_to_move):
+	result = {"items": len(list_to_move)}
+	if len(list_to_move) == 0:
+		return result
+	try:
+		result["queued"] = sink(list_to_move)
+	except Exception as e:
+		logger.error(f"sink {sink_name} failed: {e}")
+		result["error"] = str(e)
+	return result
+
+
+@logger.catch
+@router.post("/route_all")
+async def route_all_routine():
+	logger.info("start - hourly route all routine")
+	items_by_label = await asyncio.to_thread(get_items_by_todoist_labels, list(SINKS.keys()))
+	for label_name, list_to_move in items_by_label.items():
+		logger.info(f"number of items with label {label_name}: {len(list_to_move)!s}")
+	results = await asyncio.gather(
+		*(asyncio.to_thread(run_sink, sink_name, sink, items_by_label[label_name]) for label_name, (sink_name, sink) in SINKS.items())
+	)
+	logger.info("end - hourly route all routine")
+	return {sink_name: result for (sink_name, _), result in zip(SINKS.values(), results)}
+
+
+@logger.catch
+@router.post("/drain_outbox")
+def drain_outbox_routine():
+	logger.info("start - drain outbox")
+	result = drain_outbox()
+	logger.info("end - drain outbox")
+	return result
+
+
 @logger.catch
 @router.post("/todoist_to_notion_routine")
 def todoist_to_tpt_routine():
 	logger.info("start - hourly todoist to tpt routine")
 	list_to_move = get_items_by_todoist_label(TO_TPT_LABEL_NAME)
 	logger.info(f"number of items to move from Todoist to Notion - TPT: {len(list_to_move)!s}")
-	tech_database = get_value("tech", "name", DATABASES)["id"]
-	for item_to_move in list_to_move:
-		add_task_to_notion_database(tech_database, item_to_move)
-		move_item_to_notion_done(item_to_move)
-		set_done_label(item_to_move, "TPT")
-		complete_task(item_to_move)
+	route_to_tpt(list_to_move)
 	logger.info("end - hourly todoist to tpt routine")
 	return list_to_move
 
@@ -70,13 +133,7 @@ def todoist_to_microjournal_routine():
 	logger.info("start - hourly todoist to microjournal routine")
 	list_to_move = get_items_by_todoist_label(TO_MICROJOURNAL_LABEL_NAME)
 	logger.info(f"number of items to move from Todoist to Microjournal: {len(list_to_move)!s}")
-	if len(list_to_move) > 0:
-		# add_to_monica_microjournal(list_to_move)
-		add_to_obsidian_microjournal(list_to_move)
-		for item_to_move in list_to_move:
-			move_item_to_microjournal_done(item_to_move)
-			set_done_label(item_to_move, "Microjournal")
-			complete_task(item_to_move)
+	route_to_microjournal(list_to_move)
 	logger.info("end - hourly todoist to microjournal routine")
 
 
@@ -86,11 +143,7 @@ def todoist_to_work_routine():
 	logger.info("start - hourly todoist to work-inbox routine")
 	list_to_move = get_items_by_todoist_label(TO_WORK_LABEL_NAME)
 	logger.info(f"number of items to move from Todoist to Work: {len(list_to_move)!s}")
-	if len(list_to_move) > 0:
-		add_to_work_inbox(list_to_move)
-		for item_to_move in list_to_move:
-			move_item_to_work_done(item_to_move)
-			set_done_label(item_to_move, "Work")
+	route_to_work(list_to_move)
 	logger.info("end - hourly todoist to work-inbox routine")
 
 
@@ -100,11 +153,7 @@ def todoist_to_mm_routine():
 	logger.info("start - hourly todoist to mm routine")
 	list_to_move = get_items_by_todoist_label(TO_MM_LABEL_NAME)
 	logger.info(f"number of items to move from Todoist to Notion - MM: {len(list_to_move)!s}")
-	mm_database = get_value("mindfull_mastery", "name", DATABASES)["id"]
-	for item_to_move in list_to_move:
-		add_task_to_notion_database(mm_database, item_to_move)
-		move_item_to_notion_done(item_to_move)
-		set_done_label(item_to_move, "MM")
+	route_to_mm(list_to_move)
 	logger.info("end - hourly todoist to mm routine")
 
 
@@ -114,9 +163,7 @@ def todoist_to_wishlist_routine():
 	logger.info("start - hourly todoist to wishlist routine")
 	list_to_move = get_items_by_todoist_label(TO_WISHLIST_LABEL_NAME)
 	logger.info(f"number of items to move from Todoist to Notion - Wishlist: {len(list_to_move)!s}")
-	for item_to_move in list_to_move:
-		add_task_to_notion_database(WISHLIST_ID, item_to_move, priority=-1)
-		complete_task(item_to_move)
+	route_to_wishlist(list_to_move)
 	logger.info("end - hourly todoist to wishlist routine")
 
 
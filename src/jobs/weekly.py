@@ -11,12 +11,12 @@ from src.services.notion_service import (
 	get_random_from_notion_database,
 )
 from src.services.todoist_service import (
-	PROJECT_DICT,
-	check_due,
-	check_next_week,
 	get_data,
 	get_dates,
-	move_items,
+	get_move_commands,
+	get_project_ids,
+	plan_project_moves,
+	run_todoist_sync_command_batches,
 )
 from src.services.youtube_service import add_video_annotate_task, add_video_transcribe_tasks
 
@@ -32,28 +32,10 @@ def update_todoist_projects():
 
 	df_items_due, df_projects, df_items_next_week = get_data()
 
-	temp_project_dict = PROJECT_DICT.copy()
-
-	week_list = get_dates()
-	df_items_due.apply(
-		lambda row: check_due(
-			row["id"],
-			row["due"],
-			row["project_id"],
-			week_list,
-			df_projects,
-			temp_project_dict,
-		),
-		axis=1,
-	)
-	if len(df_items_next_week.index) > 0:
-		df_items_next_week.apply(
-			lambda row: check_next_week(row["id"], row["project_id"], df_projects, temp_project_dict),
-			axis=1,
-		)
-	# remove duplicates from project dict
-	temp_project_dict = {k: v for k, v in temp_project_dict.items() if v is not None}
-	move_items(PROJECT_DICT, df_projects)
+	moves = plan_project_moves(df_items_due, df_items_next_week, get_project_ids(df_projects), get_dates())
+	logger.info(f"moving {len(moves.index)} tasks: {moves.groupby('target_project_id').size().to_dict()}")
+	if len(moves.index) > 0:
+		run_todoist_sync_command_batches(get_move_commands(moves))
 	logger.info("end weekly - todoist projects")
 
 
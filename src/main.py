@@ -1,5 +1,7 @@
+import asyncio
 import os
 import traceback
+from contextlib import asynccontextmanager
 from pathlib import Path
 from sys import platform
 
@@ -12,6 +14,7 @@ from quarter_lib.logging import setup_logging
 from src.config.api_documentation import description, tags_metadata, title
 from src.helper.google_helper import test_service
 from src.helper.network_helper import log_request_info
+from src.helper.storage_helper import check_data_dir
 from src.jobs import (
 	monthly,
 	bi_weekly,
@@ -19,6 +22,7 @@ from src.jobs import (
 	hourly,
 	weekly,
 )
+from src.services.outbox_service import run_outbox_drainer
 from src.services.telegram_service import send_to_telegram
 
 controllers = [bi_weekly, monthly, daily, hourly, weekly]
@@ -28,7 +32,17 @@ logger = setup_logging(__name__)
 DEBUG = platform == "darwin" or platform == "win32" or platform == "Windows"
 IS_CONTAINER = os.environ.get("IS_CONTAINER", "False") == "True"
 logger.info(f"Variables:\nDEBUG: {DEBUG}\nIS_CONTAINER: {IS_CONTAINER}\nplatform: {platform}")
-app = FastAPI(openapi_tags=tags_metadata, title=title, description=description)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	check_data_dir()
+	drainer = asyncio.create_task(run_outbox_drainer())
+	yield
+	drainer.cancel()
+
+
+app = FastAPI(openapi_tags=tags_metadata, title=title, description=description, lifespan=lifespan)
 
 # app = FastAPI(debug=DEBUG)
 router = APIRouter()
@@ -1,10 +1,12 @@
-import time
+import asyncio
+from functools import lru_cache
 
 from quarter_lib.logging import setup_logging
 
 from src.services.telegram_service import send_to_telegram
 from src.services.todoist_service import (
-	get_items_by_todoist_project,
+	TODOIST_STATE,
+	get_item_counts_by_todoist_project,
 	get_rework_projects,
 	run_todoist_sync_commands,
 )
@@ -13,16 +15,42 @@ logger = setup_logging(__file__)
 
 OBSIDIAN_AUTOSTART_TRIGGER = "Obsidian-Eintrag überdenken"
 
-NUMBER_OF_ITEMS_PER_CHUNK = 40
+# largest batch the Sync API accepts; throttling only happens when Todoist answers with 429
+NUMBER_OF_ITEMS_PER_CHUNK = 100
+MAX_RETRIES = 5
 
 def get_smallest_project():
 	rework_projects = get_rework_projects()
-	project_sizes = [len(get_items_by_todoist_project(project.id)) for project in rework_projects]
+	project_sizes = get_item_counts_by_todoist_project([project.id for project in rework_projects])
 	min_size = min(project_sizes)
 	idx = project_sizes.index(min_size)
 	return rework_projects[idx], min_size, idx
 
 
+@lru_cache(maxsize=4096)
+def parse_book_rework_content(content) -> tuple[str, str] | None:
+	"""(annotation, book) of a Book-Rework task; cached, so only new or changed contents are split."""
+	split_content = content.split(" - ")
+	if len(split_content) == 3:
+		return split_content[0], split_content[1]
+	if len(split_content) >= 2 and split_content[-1] == OBSIDIAN_AUTOSTART_TRIGGER:
+		return "".join(split_content[:-2]), split_content[-2]
+	logger.error(f"item with content '{content}' has no book")
+	return None
+
+
+def get_book_rework_items() -> list[dict]:
+	"""Open items of all Book-Rework projects with their parsed annotation and book, read after a single sync."""
+	rework_projects = get_rework_projects()
+	items = []
+	for project in rework_projects:
+		for item in TODOIST_STATE.get_items(project_id=project.id):
+			parsed = parse_book_rework_content(item.content)
+			if parsed is not None:
+				items.append({"orig_item": item, "annotation": parsed[0], "book": parsed[1]})
+	return items
+
+
 def split_str_to_chars(text, chars=2047):
 	return [text[i : i + chars] for i in range(0, len(text), chars)][0]
 
@@ -55,25 +83,47 @@ async def add_rework_tasks(tasks):
 					},
 				)
 		logger.info(f"adding batch of {len(command_list)} tasks")
-		chunks_of_40 = list(chunks(command_list, NUMBER_OF_ITEMS_PER_CHUNK))
-		for chunk in chunks_of_40:
+		for chunk in chunks(command_list, NUMBER_OF_ITEMS_PER_CHUNK):
 			logger.info(f"adding chunk of {len(chunk)} tasks")
-			response = run_todoist_sync_commands(chunk)
+			response = await send_sync_commands(chunk)
 			logger.info(f"response code {response.status_code}")
 			if response.status_code != 200:
 				logger.error(f"response body {response.text}")
 				raise Exception("Error while adding to Todoist " + response.text)
 			logger.info(f"response:\n{response.json()}")
 			await send_to_telegram(f"Added {len(chunk)} tasks")
-			if len(chunk) == NUMBER_OF_ITEMS_PER_CHUNK:
-				logger.info("sleeping for 10 seconds")
-				time.sleep(10)
 	else:
 		error_message = f"Project {project.id} is full and cannot handle {len(tasks)} more tasks"
 		await send_to_telegram(error_message)
 		raise Exception(error_message)
 
 
+def get_retry_after(response) -> float | None:
+	"""Seconds to wait after a 429, from the Retry-After header or the error_extra of the Sync API error body."""
+	retry_after = response.headers.get("Retry-After")
+	if retry_after is None:
+		try:
+			retry_after = response.json().get("error_extra", {}).get("retry_after")
+		except ValueError:
+			return None
+	try:
+		return float(retry_after)
+	except (TypeError, ValueError):
+		return None
+
+
+async def send_sync_commands(commands):
+	# the commands keep their uuids between attempts, so Todoist ignores the ones it already applied
+	for attempt in range(MAX_RETRIES + 1):
+		response = await asyncio.to_thread(run_todoist_sync_commands, commands)
+		if response.status_code != 429 or attempt == MAX_RETRIES:
+			return response
+		delay = get_retry_after(response) or min(2**attempt, 60)
+		logger.warning(f"rate limited by Todoist - retrying in {delay}s")
+		await asyncio.sleep(delay)
+	return response
+
+
 def chunks(lst, n):
 	for i in range(0, len(lst), n):
 		yield lst[i : i + n]
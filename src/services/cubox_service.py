@@ -1,5 +1,4 @@
 import re
-import time
 from datetime import datetime
 
 import numpy as np
@@ -8,10 +7,11 @@ import yaml
 from dateutil import parser
 from quarter_lib.logging import setup_logging
 
+from src.helper.notion_query import equals
 from src.helper.path_helper import slugify
 from src.services.book_note_service import add_rework_tasks
 from src.services.github_service import add_files_to_repository, get_files
-from src.services.notion_service import NOTION_IDS, get_database, update_notion_page_checkbox
+from src.services.notion_service import NOTION_CLIENT, NOTION_IDS, get_database, update_notion_page_checkbox_async
 from src.services.todoist_service import THIS_WEEK_PROJECT_ID, add_todoist_task, get_vacation_mode, get_cubox_rework_items
 
 logger = setup_logging(__file__)
@@ -36,10 +36,41 @@ GROUP_COLUMNS = sorted(
 )
 
 
+COLLECTION_COLUMNS = [
+	"id",
+	"created",
+	"description",
+	"done",
+	"original_link",
+	"folder",
+	"type",
+	"cubox_deep_link",
+	"tags",
+	"updated",
+	"title",
+]
+
+
 def get_collections_data(done_reading=True, synced_to_obsidian=False) -> pd.DataFrame:
-	df_collections = get_database(COLLECTIONS_ID)
-	df_collections = df_collections[df_collections["properties~Done~formula~boolean"] == done_reading]
-	df_collections = df_collections[df_collections["properties~SyncedToObsidian~checkbox"] == synced_to_obsidian]
+	df_collections = get_database(
+		COLLECTIONS_ID,
+		conditions=[equals("Done", done_reading), equals("SyncedToObsidian", synced_to_obsidian)],
+		properties=[
+			"Title",
+			"Created",
+			"Description",
+			"Done",
+			"Original Link",
+			"Folder",
+			"Type",
+			"Cubox Deep Link",
+			"Tags",
+			"Updated",
+		],
+	)
+	if df_collections.empty:
+		# nothing to sync is the usual case; the filtered query then returns no pages to read titles from
+		return pd.DataFrame(columns=COLLECTION_COLUMNS)
 	df_collections["title"] = df_collections["properties~Title~title"].apply(lambda x: x[0]["plain_text"])
 	df_collections = df_collections[
 		[
@@ -142,7 +173,7 @@ def generate_content_from_annotations(annotations: pd.DataFrame, list_of_tasks:
 
 async def add_cubox_annotations_to_obsidian() -> None:
 	df_merge = get_merged_cubox_data()
-	list_of_files, list_of_tasks = [], []
+	list_of_files, list_of_tasks, synced_collections = [], [], []
 	for group_keys, annotations in df_merge.groupby(GROUP_COLUMNS):
 		group_dict = dict(zip(GROUP_COLUMNS, group_keys))
 		tags = set([f'"{item}"' for sublist in annotations["tags"].tolist() for item in sublist])
@@ -172,10 +203,12 @@ async def add_cubox_annotations_to_obsidian() -> None:
 			return_string += content
 		list_of_files.append({"filename": f"{slugify(group_dict['title'])}.md", "content": return_string})
 
-		update_checkbox_result = update_notion_page_checkbox(group_dict["id_collection"], "SyncedToObsidian", True)
-		logger.info(update_checkbox_result)
-		logger.info(f"Updated Notion page {group_dict['id_collection']} for {group_dict['title']}")
-		time.sleep(5)
+		synced_collections.append(group_dict["id_collection"])
+
+	update_checkbox_results = await NOTION_CLIENT.run_all_async(
+		update_notion_page_checkbox_async(page_id, "SyncedToObsidian", True) for page_id in synced_collections
+	)
+	logger.info(f"Updated {len([result for result in update_checkbox_results if result])} of {len(synced_collections)} Notion pages")
 
 	if list_of_files:
 		add_files_to_repository(list_of_files, f"obsidian-refresher: {datetime.now()}", "0200_Sources/Websites/")
@@ -206,6 +239,9 @@ def add_cubox_reading_task_to_todoist(weighted=True) -> None:
 		return
 
 	df_collections = get_collections_data(done_reading=False, synced_to_obsidian=False)
+	if df_collections.empty:
+		logger.info("No unread cubox collections - skipping cubox reading task")
+		return
 	df_collections.sort_values("created", ascending=False, inplace=True)
 	df_collections["cubox_deep_link_mobile"] = df_collections["cubox_deep_link"].apply(lambda x: get_mobile_deep_link(x))
 
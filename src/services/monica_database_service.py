@@ -2,20 +2,18 @@ import os
 from datetime import datetime, timedelta
 
 import yaml
-from dateutil.relativedelta import relativedelta
 
 from uuid import uuid4
 
 import pandas as pd
 import pymysql.cursors
-from github import UnknownObjectException
 from loguru import logger
 
 from src.config.queries import activity_query, shortened_activity_query
 from src.helper.database_helper import close_server_connection, create_server_connection
 from src.helper.date_helper import get_date_or_datetime
-from src.services.github_service import create_obsidian_markdown_in_git, get_files
-from src.services.notion_service import get_drugs_from_activity
+from src.services.github_service import create_obsidian_markdown_files_in_git
+from src.services.notion_service import get_drugs_for_dates
 from src.services.todoist_service import get_default_offset
 
 
@@ -174,36 +172,26 @@ def delete_inbox_activity(connection, activity_id):
 
 async def add_to_be_deleted_activities_to_obsidian(deletion_list):
 	deleted_list = []
-	drug_date_dict = {}
 	connection = create_server_connection("monica")
 	timestamp = datetime.now()
-	# get files for the current month and the last month
 	try:
-		files_in_repo = get_files(f"0300_Spaces/Social Circle/Activities/{timestamp.year!s}/{timestamp.strftime('%m-%B')!s}")
-	except UnknownObjectException as e: # folder for month not created yet
-		logger.error(f"UnknownObjectException: {e}")
-		files_in_repo = []
-	files_in_repo.extend(
-		get_files(
-			f"0300_Spaces/Social Circle/Activities/{(timestamp - relativedelta(months=1)).year!s}/{(timestamp - relativedelta(months=1)).strftime('%m-%B')!s}"
-		)
-	)
-	with connection.cursor() as cursor:
-		for activity_id in deletion_list:
-			try:
-				query = activity_query.format(activity_id=activity_id)
-				cursor.execute(query)
-				for row in cursor:
-					drug_date_dict = get_drugs_from_activity(row, drug_date_dict)
-					if "No-GitHub" not in row["people"]:
-						await create_obsidian_markdown_in_git(row, timestamp, drug_date_dict, files_in_repo)
-					delete_inbox_activity(connection, activity_id)
-					deleted_list.append(row)
-			except pymysql.err.IntegrityError as e:
-				logger.error(f"IntegrityError: {e}")
+		with connection.cursor() as cursor:
+			activities = {}
+			for activity_id in deletion_list:
+				cursor.execute(activity_query.format(activity_id=activity_id))
+				activities[activity_id] = cursor.fetchall()
+		drug_date_dict = get_drugs_for_dates([row["happened_at"] for rows in activities.values() for row in rows])
+		rows_to_export = [row for rows in activities.values() for row in rows if "No-GitHub" not in row["people"]]
+		# the inbox rows are only deleted once the commit with all activities exists
+		await create_obsidian_markdown_files_in_git(rows_to_export, timestamp, drug_date_dict)
+		for activity_id, rows in activities.items():
+			if not rows:
 				continue
+			delete_inbox_activity(connection, activity_id)
+			deleted_list.extend(rows)
 			logger.info(f"Activity with id {activity_id} was added to obsidian")
-	close_server_connection(connection)
+	finally:
+		close_server_connection(connection)
 	return deleted_list
 
 
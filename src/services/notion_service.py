@@ -1,16 +1,23 @@
+import asyncio
+import bisect
 import json
-import time
+import math
 import urllib.parse
 from datetime import datetime, timedelta
 
 import pandas as pd
-import requests
 from quarter_lib.akeyless import get_secrets
 from quarter_lib.logging import setup_logging
 
+from src.helper.caching import ttl_cache
 from src.helper.config_helper import get_config, get_value
+from src.helper.notion_client import NotionClient, gather
+from src.helper.notion_frame import pages_to_frame
+from src.helper.notion_mirror import NotionMirror
+from src.helper.notion_query import build_query, equals, greater_than, is_empty, is_not_empty
+from src.helper.storage_helper import connect
 from src.helper.web_helper import get_notion_ids_from_web
-from src.services.tandoor_service import get_recipes_from_db, get_cook_log_from_db
+from src.services.tandoor_service import get_latest_cook_log_per_recipe_from_db, get_recipes_from_db
 from src.services.todoist_history_service import get_completed_tasks
 from src.services.todoist_service import (
     DAILY_SECTION_ID,
@@ -23,12 +30,8 @@ logger = setup_logging(__file__)
 
 NOTION_TOKEN = get_secrets(["notion/token"])
 
-BASE_URL = "https://api.notion.com/v1/"
-HEADERS = {
-    "Authorization": "Bearer " + NOTION_TOKEN,
-    "Content-Type": "application/json",
-    "Notion-Version": "2021-08-16",
-}
+NOTION_CLIENT = NotionClient(NOTION_TOKEN)
+NOTION_MIRROR = NotionMirror(NOTION_CLIENT)
 
 NOTION_IDS = get_notion_ids_from_web()
 
@@ -38,6 +41,25 @@ WISHLIST_ID = NOTION_IDS["WISHLIST_ID"]
 
 
 DATABASES = get_config("databases_config.json")
+# spacing of the sparse priority keys used by the stretched lists
+PRIORITY_GAP = 100
+# several routes look up habit tracker dates within one run, one mirror refresh is enough for them
+DATE_INDEX_MAX_AGE = 5 * 60
+DRUG_CACHE_FILE = "notion_drugs.sqlite3"
+TEXT_BLOCK_TYPES = {
+    "paragraph",
+    "heading_1",
+    "heading_2",
+    "heading_3",
+    "bulleted_list_item",
+    "numbered_list_item",
+    "to_do",
+    "toggle",
+    "quote",
+    "callout",
+}
+# children of these blocks belong to another page
+NESTED_PAGE_BLOCK_TYPES = {"child_page", "child_database"}
 UNWANTED_COLUMNS = [
     "Date",
     "Day of Week",
@@ -52,24 +74,29 @@ UNWANTED_COLUMNS = [
 ]
 
 
-def get_database(database_id):
-    url = BASE_URL + "databases/" + database_id + "/query"
-    result_list = []
-    body = None
+@ttl_cache(ttl=60 * 60)
+def get_database_schema(database_id):
+    response = NOTION_CLIENT.run(NOTION_CLIENT.request("GET", "databases/" + database_id))
+    response.raise_for_status()
+    return response.json()["properties"]
+
+
+def get_database(database_id, conditions=None, properties=None, max_age=0):
+    """
+    Without conditions and properties the whole database is served from the local mirror, which is refreshed
+    unless that happened less than max_age seconds ago. Otherwise the conditions are sent as Notion filter
+    and only the listed properties are returned.
+    """
     logger.info("get_database - database_id: " + database_id)
-    while True:
-        r = (
-            requests.post(url, headers=HEADERS).json()
-            if body is None
-            else requests.post(url, data=json.dumps(body), headers=HEADERS).json()
-        )
-        for results in r["results"]:
-            result_list.append(results)
-        body = {"start_cursor": r.get("next_cursor")}
-        if not r["has_more"]:
-            break
+    schema = get_database_schema(database_id)
+    if conditions is None and properties is None:
+        NOTION_CLIENT.run(NOTION_MIRROR.refresh(database_id, max_age))
+        result_list = NOTION_MIRROR.get_pages(database_id)
+    else:
+        body, params = build_query(schema, conditions, properties)
+        result_list = NOTION_CLIENT.run(NOTION_CLIENT.query_database(database_id, body, params))
     logger.info("length of result_list: " + str(len(result_list)))
-    return pd.json_normalize(result_list, sep="~")
+    return pages_to_frame(result_list, schema, properties)
 
 
 def get_priorities(df):
@@ -90,119 +117,84 @@ def get_title(row):
 
 
 def get_random_row_from_notion_tech_database(database_id):
-    df = get_database(database_id)
+    df = get_database(
+        database_id,
+        conditions=[
+            equals("Synced-to-Todoist", False),
+            equals("Obsolet", False),
+            equals("Status", "Not started"),
+            is_empty("Completed"),
+        ],
+        properties=["Name", "Priority", "Completed"],
+    )
 
     df["properties~Name~title~content"] = df["properties~Name~title"].apply(lambda row: get_title(row))
-    df = df[df["properties~Synced-to-Todoist~checkbox"] == False]
-    df = df[df["properties~Obsolet~checkbox"] == False]
-    df = df[df["properties~Status~status~name"] == "Not started"]
-
-    try:
-        df = df[
-            [
-                "id",
-                "properties~Name~title~content",
-                "properties~Priority~number",
-                "properties~Completed~date~start",
-                "created_time",
-                "last_edited_time",
-                "url",
-            ]
-        ]
-        df["properties~Completed~date~start"] = pd.to_datetime(df["properties~Completed~date~start"])
-        df = df[df["properties~Completed~date~start"].isnull()]
-    except Exception:
-        df = df[
-            [
-                "id",
-                "properties~Name~title~content",
-                "properties~Priority~number",
-                "properties~Completed~date~start",
-                "created_time",
-                "last_edited_time",
-                "url",
-            ]
-        ]
-        df["properties~Completed~date~start"] = df["properties~Completed~date"]
-        df = df[
-            [
-                "id",
-                "properties~Name~title~content",
-                "properties~Priority~number",
-                "properties~Completed~date~start",
-                "created_time",
-                "last_edited_time",
-                "url",
-            ]
+    df = df[
+        [
+            "id",
+            "properties~Name~title~content",
+            "properties~Priority~number",
+            "properties~Completed~date~start",
+            "created_time",
+            "last_edited_time",
+            "url",
         ]
+    ]
+    df = df[df["properties~Completed~date~start"].isnull()]
     selected_row = get_priorities(df)
     return selected_row
 
 
 def get_random_row_from_link_list(database_id):
-    df = get_database(database_id)
+    df = get_database(
+        database_id,
+        conditions=[
+            equals("Synced-to-Todoist", False),
+            equals("Not-Available", False),
+            is_empty("Dates Read"),
+        ],
+        properties=["Name", "Synced-to-Todoist", "URL", "Dates Read", "Priority", "Pages", "Not-Available"],
+    )
     df["properties~Name~title~content"] = df["properties~Name~title"].apply(
         lambda row: row[0]["text"]["content"] if len(row) > 0 else "No Title"
     )
-    try:
-        df = df[
-            [
-                "id",
-                "properties~Name~title~content",
-                "properties~Synced-to-Todoist~checkbox",
-                "properties~URL~url",
-                "properties~Dates Read~date~start",
-                "properties~Priority~number",
-                "properties~Pages~number",
-                "properties~Not-Available~checkbox",
-                "created_time",
-                "last_edited_time",
-            ]
-        ]
-        df["properties~Dates Read~date~start"] = pd.to_datetime(df["properties~Dates Read~date~start"])
-        df = df[df["properties~Dates Read~date~start"].isnull()]
-    except Exception:
-        df["properties~Dates Read~date~start"] = df["properties~Dates Read~date"]
-        df = df[
-            [
-                "id",
-                "properties~Name~title~content",
-                "properties~Synced-to-Todoist~checkbox",
-                "properties~URL~url",
-                "properties~Dates Read~date~start",
-                "properties~Priority~number",
-                "properties~Pages~number",
-                "properties~Not-Available~checkbox",
-                "created_time",
-                "last_edited_time",
-            ]
+    df = df[
+        [
+            "id",
+            "properties~Name~title~content",
+            "properties~Synced-to-Todoist~checkbox",
+            "properties~URL~url",
+            "properties~Dates Read~date~start",
+            "properties~Priority~number",
+            "properties~Pages~number",
+            "properties~Not-Available~checkbox",
+            "created_time",
+            "last_edited_time",
         ]
-    df = df[df["properties~Synced-to-Todoist~checkbox"] == False]
-    df = df[df["properties~Not-Available~checkbox"] == False]
+    ]
+    df = df[df["properties~Dates Read~date~start"].isnull()]
     selected_row = get_priorities(df)
     return selected_row
 
 
 def update_notion_page(page_id):
-    url = BASE_URL + "pages/" + page_id
-    data = {"properties": {"Synced-to-Todoist": {"checkbox": True}}}
-    requests.patch(url, data=json.dumps(data), headers=HEADERS).json()
+    NOTION_CLIENT.run(NOTION_CLIENT.update_page(page_id, {"Synced-to-Todoist": {"checkbox": True}}))
 
 
-def update_notion_page_checkbox(page_id, checkbox_name, checkbox_value):
-    url = BASE_URL + "pages/" + page_id
-    data = {"properties": {checkbox_name: {"checkbox": checkbox_value}}}
-    r = requests.patch(url, data=json.dumps(data), headers=HEADERS)
+async def update_notion_page_checkbox_async(page_id, checkbox_name, checkbox_value):
+    r = await NOTION_CLIENT.update_page(page_id, {checkbox_name: {"checkbox": checkbox_value}})
     if r.status_code == 200:
         logger.info("Updated notion page " + page_id + " with checkbox " + checkbox_name)
         return r.json()
     logger.error("Error updating notion page " + page_id + " with checkbox " + checkbox_name)
 
 
+def update_notion_page_checkbox(page_id, checkbox_name, checkbox_value):
+    return NOTION_CLIENT.run(update_notion_page_checkbox_async(page_id, checkbox_name, checkbox_value))
+
+
 def get_article_database():
     article_database = get_value("article", "name", DATABASES)["id"]
-    url = BASE_URL + "databases/" + article_database + "/query"
-    result_list = []
     data = {
         "filter": {
             "and": [
@@ -219,25 +211,13 @@ def get_article_database():
             ]
         }
     }
-    while True:
-        r = (
-            requests.post(url, headers=HEADERS).json()
-            if data is None
-            else requests.post(url, data=json.dumps(data), headers=HEADERS).json()
-        )
-        for results in r["results"]:
-            result_list.append(results)
-        data = {"start_cursor": r.get("next_cursor")}
-        if not r["has_more"]:
-            break
+    result_list = NOTION_CLIENT.run(NOTION_CLIENT.query_database(article_database, data))
     logger.info("length of result_list: " + str(len(result_list)))
-    return pd.json_normalize(result_list, sep="~")
+    return pages_to_frame(result_list, get_database_schema(article_database))
 
 
 def get_article_database_already_downloaded():
     article_database = get_value("article", "name", DATABASES)["id"]
-    url = BASE_URL + "databases/" + article_database + "/query"
-    result_list = []
     data = {
         "filter": {
             "and": [
@@ -254,34 +234,73 @@ def get_article_database_already_downloaded():
             ]
         }
     }
+    result_list = NOTION_CLIENT.run(NOTION_CLIENT.query_database(article_database, data))
+    logger.info("length of result_list: " + str(len(result_list)))
+    return pages_to_frame(result_list, get_database_schema(article_database))
+
+
+async def get_block_children(block_id):
+    children = []
+    params = {"page_size": 100}
     while True:
-        r = (
-            requests.post(url, headers=HEADERS).json()
-            if data is None
-            else requests.post(url, data=json.dumps(data), headers=HEADERS).json()
-        )
-        for results in r["results"]:
-            result_list.append(results)
-        data = {"start_cursor": r.get("next_cursor")}
+        response = await NOTION_CLIENT.request("GET", "blocks/" + block_id + "/children", params=params)
+        response.raise_for_status()
+        r = response.json()
+        children.extend(r["results"])
         if not r["has_more"]:
-            break
-    logger.info("length of result_list: " + str(len(result_list)))
-    return pd.json_normalize(result_list, sep="~")
+            return children
+        params["start_cursor"] = r["next_cursor"]
 
 
-def get_text_from_article(row):
-    url = "https://api.notion.com/v1/blocks/" + row["id"]
-    response = requests.get(url, headers=HEADERS).json()
-    if not response["has_children"]:
+async def get_block_tree_text(block_id):
+    """Plain text of all text blocks below `block_id` in document order; nested blocks are fetched concurrently."""
+    children = await get_block_children(block_id)
+    nested = await gather(
+        get_block_tree_text(block["id"])
+        for block in children
+        if block.get("has_children") and block["type"] not in NESTED_PAGE_BLOCK_TYPES
+    )
+    nested = iter(nested)
+    parts = []
+    for block in children:
+        if block["type"] in TEXT_BLOCK_TYPES:
+            value = block[block["type"]]
+            # Notion-Version 2021-08-16 calls the rich text "text", newer versions "rich_text"
+            text = "".join(part["plain_text"] for part in value.get("rich_text", value.get("text", [])))
+            if text:
+                parts.append(text)
+        if block.get("has_children") and block["type"] not in NESTED_PAGE_BLOCK_TYPES:
+            text = next(nested)
+            if text:
+                parts.append(text)
+    return "\n".join(parts)
+
+
+async def get_text_from_article_async(row):
+    content = await get_block_tree_text(row["id"])
+    if not content:
         return None
-    url = "https://api.notion.com/v1/blocks/" + row["id"] + "/children"
-    response = requests.get(url, headers=HEADERS).json()
-    content = ""
-    for block in response["results"]:
-        if block["type"] == "paragraph":
-            content += block["paragraph"]["text"][0]["plain_text"]
-    content = content.replace("\n", " ")
-    return content
+    return content.replace("\n", " ")
+
+
+async def iter_texts_from_articles(df):
+    """
+    Yields (row, text, error) for every article of `df` as soon as its text is fetched. All articles are
+    fetched concurrently on the shared client, so the rate limit still applies.
+    """
+
+    async def fetch(row):
+        try:
+            return row, await NOTION_CLIENT.run_async(get_text_from_article_async(row)), None
+        except Exception as e:
+            return row, None, e
+
+    for next_done in asyncio.as_completed([fetch(row) for _, row in df.iterrows()]):
+        yield await next_done
+
+
+def get_text_from_article(row):
+    return NOTION_CLIENT.run(get_text_from_article_async(row))
 
 
 def transform_content(content):
@@ -302,25 +321,16 @@ def check_habits(data_frame, checked_date):
     return transform_content(data_frame["item_object_content"])
 
 
+def get_date_index(database_id):
+    """Pages of a database with a "Date" property, indexed by that date (YYYY-MM-DD) and served from the mirror."""
+    df = get_database(database_id, max_age=DATE_INDEX_MAX_AGE)
+    df["date"] = df["properties~Date~date~start"].str[:10]
+    return df.dropna(subset=["date"]).drop_duplicates(subset="date").set_index("date")
+
+
 def get_page_for_date(date, database_id=None):
     if database_id is not None:
-        url = BASE_URL + "databases/" + database_id + "/query"
-        body = {
-            "filter": {
-                "property": "Date",
-                "date": {"equals": date.strftime("%Y-%m-%d")},
-            }
-        }
-
-        result_list = []
-        while True:
-            r = requests.post(url, data=json.dumps(body), headers=HEADERS).json()
-            for results in r["results"]:
-                result_list.append(results)
-            body["start_cursor"] = r.get("next_cursor")
-            if not r["has_more"]:
-                break
-        return pd.json_normalize(result_list, sep="~").iloc[0]
+        return get_date_index(database_id).loc[date.strftime("%Y-%m-%d")]
 
 
 def get_page_for_date_old(date, database_id=None, df=None):
@@ -331,12 +341,18 @@ def get_page_for_date_old(date, database_id=None, df=None):
     return df.loc[df["properties~Date~date~start"] == date.strftime("%Y-%m-%d")].iloc[0]
 
 
-def update_notion_habit_tracker_page(page_id, completed_habits):
-    url = BASE_URL + "pages/" + page_id
-    for habit in completed_habits:
-        data = {"properties": {habit: {"checkbox": True}}}
-        requests.patch(url, data=json.dumps(data), headers=HEADERS).json()
-        logger.info("'" + habit + "' checked on page '" + page_id + "'")
+def update_notion_habit_tracker_page(page_id, completed_habits, database_id=None):
+    if not completed_habits:
+        return
+    properties = {habit: {"checkbox": True} for habit in completed_habits}
+    r = NOTION_CLIENT.run(NOTION_CLIENT.update_page(page_id, properties))
+    if r.status_code != 200:
+        logger.error(r.status_code)
+        logger.error(r.text)
+        return
+    logger.info("'" + "', '".join(completed_habits) + "' checked on page '" + page_id + "'")
+    if database_id is not None:
+        NOTION_MIRROR.store_page(database_id, r.json())
 
 
 def update_notion_habit_tracker():
@@ -351,7 +367,7 @@ def update_notion_habit_tracker():
         datetime.today() - timedelta(days=1),
         habit_tracker_database["id"],
     )["id"]
-    update_notion_habit_tracker_page(page_id, completed_habits)
+    update_notion_habit_tracker_page(page_id, completed_habits, habit_tracker_database["id"])
 
 
 def update_habit_tracker_vacation_mode():
@@ -360,7 +376,7 @@ def update_habit_tracker_vacation_mode():
         datetime.today(),
         habit_tracker_database["id"],
     )["id"]
-    update_notion_habit_tracker_page(page_id, ["Vacation"])
+    update_notion_habit_tracker_page(page_id, ["Vacation"], habit_tracker_database["id"])
 
 
 def get_random_from_notion_database(database_id):
@@ -399,8 +415,7 @@ def get_random_from_notion_link_list(database_id, df_projects=None, due="Tomorro
     update_notion_page(selected_row["id"])
 
 
-def add_task_to_notion_database(database_id, todoist_item, priority=None):
-    url = BASE_URL + "pages"
+def get_task_page_data(database_id, todoist_item, priority=None):
     if todoist_item.description:
         data = {
             "parent": {"database_id": database_id},
@@ -431,53 +446,83 @@ def add_task_to_notion_database(database_id, todoist_item, priority=None):
                 "Priority": {"type": "number", "number": 0 if priority is None else priority},
             },
         }
-    r = requests.post(url, data=json.dumps(data), headers=HEADERS).json()
-    logger.info(r)
+    return data
 
 
-def get_drugs_from_activity(row, drug_date_dict):
-    happened_at = row["happened_at"]
-    if happened_at in drug_date_dict.keys():
-        return drug_date_dict
-    drug_tracker_database_id = get_value("drug", "name", DATABASES)["id"]
-    url = BASE_URL + "databases/" + drug_tracker_database_id + "/query"
-    body = {
-        "filter": {
-            "property": "Date",
-            "date": {"equals": happened_at.strftime("%Y-%m-%d")},
-        }
-    }
+def add_task_to_notion_database(database_id, todoist_item, priority=None):
+    data = get_task_page_data(database_id, todoist_item, priority)
+    r = NOTION_CLIENT.run(NOTION_CLIENT.create_page(data)).json()
+    logger.info(r)
+    return r
 
-    result_list = []
-    while True:
-        r = requests.post(url, data=json.dumps(body), headers=HEADERS).json()
-        try:
-            for results in r["results"]:
-                result_list.append(results)
-            body["start_cursor"] = r.get("next_cursor")
-            if not r["has_more"]:
-                break
-        except Exception:
-            break
-    if not len(result_list):
-        return drug_date_dict
-    result = result_list[0]
-    result_properties = result["properties"]
-    result_properties = [result_properties[key] for key in result_properties.keys() if key not in UNWANTED_COLUMNS]
-    drug_date_dict[happened_at] = []
-    for prop in result_properties:
-        if "multi_select" not in prop.keys():
+
+def _get_drugs_from_page(page):
+    drugs = []
+    for key, prop in page["properties"].items():
+        if key in UNWANTED_COLUMNS or "multi_select" not in prop.keys():
             continue
-        multi_select = prop["multi_select"]
-        for multi_select_item in multi_select:
-            drug_date_dict[happened_at].append(multi_select_item["name"])
-    return drug_date_dict
+        drugs.extend(multi_select_item["name"] for multi_select_item in prop["multi_select"])
+    return drugs
 
 
-def update_priority(id, priority, title):
-    url = BASE_URL + "pages/" + id
-    data = {"properties": {"Priority": {"number": priority}}}
-    r = requests.patch(url, data=json.dumps(data), headers=HEADERS)
+def _get_cached_drugs(date_keys):
+    with connect(DRUG_CACHE_FILE) as connection:
+        connection.execute("CREATE TABLE IF NOT EXISTS drugs (date TEXT PRIMARY KEY, drugs TEXT NOT NULL)")
+        rows = connection.execute(
+            f"SELECT date, drugs FROM drugs WHERE date IN ({', '.join('?' for _ in date_keys)})", list(date_keys)
+        ).fetchall()
+    return {date_key: json.loads(drugs) for date_key, drugs in rows}
+
+
+def _cache_drugs(drugs_by_date):
+    with connect(DRUG_CACHE_FILE) as connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO drugs (date, drugs) VALUES (?, ?)",
+            [(date_key, json.dumps(drugs)) for date_key, drugs in drugs_by_date.items()],
+        )
+
+
+def get_drugs_for_dates(dates):
+    """
+    Drug tracker entries for all given dates, keyed by the given date objects.
+
+    Entries of past days never change, so they are kept in a local cache; all other dates are fetched with a
+    single query over the min/max date range.
+    """
+    date_keys = {date: date.strftime("%Y-%m-%d") for date in set(dates)}
+    if not date_keys:
+        return {}
+    drugs_by_date = _get_cached_drugs(set(date_keys.values()))
+    missing = sorted(set(date_keys.values()) - drugs_by_date.keys())
+    if missing:
+        drug_tracker_database_id = get_value("drug", "name", DATABASES)["id"]
+        body = {
+            "filter": {
+                "and": [
+                    {"property": "Date", "date": {"on_or_after": missing[0]}},
+                    {"property": "Date", "date": {"on_or_before": missing[-1]}},
+                ]
+            }
+        }
+        try:
+            result_list = NOTION_CLIENT.run(NOTION_CLIENT.query_database(drug_tracker_database_id, body))
+        except Exception as e:
+            logger.error(f"Error getting drugs between {missing[0]} and {missing[-1]}: {e}")
+            result_list = []
+        fetched = {}
+        for result in result_list:
+            date_property = result["properties"]["Date"]["date"]
+            date_key = date_property["start"][:10] if date_property else None
+            if date_key in missing and date_key not in fetched:
+                fetched[date_key] = _get_drugs_from_page(result)
+        today = datetime.today().strftime("%Y-%m-%d")
+        _cache_drugs({date_key: drugs for date_key, drugs in fetched.items() if date_key < today})
+        drugs_by_date.update(fetched)
+    return {date: drugs_by_date[date_key] for date, date_key in date_keys.items() if date_key in drugs_by_date}
+
+
+async def update_priority_async(id, priority, title):
+    r = await NOTION_CLIENT.update_page(id, {"Priority": {"number": priority}})
     if r.status_code != 200:
         logger.error(r.status_code)
         logger.error(r.text)
@@ -486,78 +531,137 @@ def update_priority(id, priority, title):
     return r
 
 
+def update_priority(id, priority, title):
+    return NOTION_CLIENT.run(update_priority_async(id, priority, title))
+
+
+def update_priorities(df, target_priorities):
+    """
+    Sends only the rows whose priority differs from the target, concurrently within the rate limit.
+    Returns how many rows were updated, failed and skipped because they already had the target value.
+    """
+    current_priorities = df["properties~Priority~number"]
+    changed = df[current_priorities.isna() | (current_priorities != target_priorities)]
+    # tolist() converts to plain Python numbers, which the JSON encoder accepts
+    targets = dict(zip(target_priorities.index, target_priorities.tolist()))
+    responses = NOTION_CLIENT.run_all(
+        update_priority_async(row["id"], targets[index], row["title"]) for index, row in changed.iterrows()
+    )
+    failed = len([r for r in responses if r.status_code != 200])
+    result = {"updated": len(responses) - failed, "failed": failed, "skipped": len(df.index) - len(changed.index)}
+    logger.info(f"updated {result['updated']} rows, {result['failed']} failed, skipped {result['skipped']} unchanged rows")
+    return result
+
+
+def _get_longest_increasing_positions(values):
+    """Positions of the longest strictly increasing run of positive values (not necessarily contiguous)."""
+    tails, tail_positions, previous = [], [], {}
+    for position, value in enumerate(values):
+        if pd.isna(value) or value <= 0:
+            continue
+        index = bisect.bisect_left(tails, value)
+        previous[position] = tail_positions[index - 1] if index > 0 else None
+        if index == len(tails):
+            tails.append(value)
+            tail_positions.append(position)
+        else:
+            tails[index] = value
+            tail_positions[index] = position
+    kept = []
+    position = tail_positions[-1] if tail_positions else None
+    while position is not None:
+        kept.append(position)
+        position = previous[position]
+    return set(kept)
+
+
+def get_sparse_priorities(priorities):
+    """
+    Target priorities for rows that are already in their wanted order.
+
+    Keys are spaced PRIORITY_GAP apart. The longest increasing run of current values is kept, every other row
+    (new, moved, duplicate or empty) takes a value between its kept neighbours. Only when a gap is used up,
+    the whole list is rebalanced.
+    """
+    values = priorities.tolist()
+    kept = _get_longest_increasing_positions(values)
+    targets = [values[position] if position in kept else None for position in range(len(values))]
+
+    position = 0
+    while position < len(targets):
+        if targets[position] is not None:
+            position += 1
+            continue
+        end = position
+        while end < len(targets) and targets[end] is None:
+            end += 1
+        lower = targets[position - 1] if position > 0 else 0
+        count = end - position
+        if end == len(targets):
+            new_values = [lower + PRIORITY_GAP * (offset + 1) for offset in range(count)]
+        else:
+            upper = targets[end]
+            if (upper - lower) / (count + 1) < 1:
+                logger.info("priority gaps are used up - rebalancing the whole list")
+                return pd.Series([PRIORITY_GAP * (offset + 1) for offset in range(len(values))], index=priorities.index)
+            new_values = [lower + math.floor((upper - lower) * (offset + 1) / (count + 1)) for offset in range(count)]
+        targets[position:end] = new_values
+        position = end
+    targets = [int(value) if float(value).is_integer() else value for value in targets]
+    return pd.Series(targets, index=priorities.index, dtype=object)
+
+
 def stretch_article_list():
     logger.info("stretching Articles")
-    df = get_database(ARTICLES_ID)
+    df = get_database(
+        ARTICLES_ID,
+        conditions=[
+            equals("Not-Available", False),
+            equals("Done", False),
+            greater_than("Priority", 0),
+            is_not_empty("Medium"),
+            is_not_empty("Topics"),
+        ],
+        properties=["Name", "Priority"],
+    )
     logger.info("got Articles")
     df["title"] = df["properties~Name~title"].apply(lambda x: x[0]["plain_text"])
     df.drop(columns=["properties~Name~title"], inplace=True)
-    df = df[
-        [
-            "id",
-            "title",
-            "properties~Priority~number",
-            "properties~Not-Available~checkbox",
-            "properties~Done~checkbox",
-            "properties~Medium~select~name",
-            "properties~Topics~multi_select",
-        ]
-    ]
-    df.sort_values(by="properties~Priority~number", inplace=True)
-    df = df[df["properties~Not-Available~checkbox"] == False]
-    df = df[df["properties~Done~checkbox"] == False]
-    df = df[df["properties~Priority~number"] > 0]
-    df = df[~df["properties~Medium~select~name"].isna()]
-    df = df[df["properties~Topics~multi_select"].str.len() != 0]
+    df = df[["id", "title", "properties~Priority~number"]]
+    df = df.sort_values(by="properties~Priority~number")
 
     df.reset_index(drop=True, inplace=True)
     logger.info("filtered Articles & starting to update")
-    for index, row in df.iterrows():
-        update_priority(df.iloc[index]["id"], index + 1, df.iloc[index]["title"])
-        if (index + 1) % 10 == 0:
-            logger.info(f"updated {index + 1} rows")
-        if (index + 1) % 30 == 0:
-            logger.info(f"updated {index + 1} rows")
-        time.sleep(1)
+    result = update_priorities(df, pd.Series(df.index + 1, index=df.index))
     logger.info("Done updating Articles")
+    return result
 
 
 def stretch_project_tasks(database_id):
     logger.info("stretching database with id " + database_id)
-    df = get_database(database_id)
+    df = get_database(
+        database_id,
+        conditions=[
+            equals("Obsolet", False),
+            is_empty("Completed"),
+            is_not_empty("Priority"),
+            is_not_empty("Effort"),
+            equals("Status", "Not started"),
+            is_not_empty("Project"),
+        ],
+        properties=["Name", "Priority"],
+    )
     logger.info("got database with id " + database_id)
     df["title"] = df["properties~Name~title"].apply(lambda x: x[0]["plain_text"])
     df.drop(columns=["properties~Name~title"], inplace=True)
-    df = df[
-        [
-            "id",
-            "title",
-            "properties~Priority~number",
-            "properties~Completed~date~start",
-            "properties~Obsolet~checkbox",
-            "properties~Project~multi_select",
-            "properties~Effort~select~name",
-            "properties~Status~status~name",
-        ]
-    ]
-    df.sort_values(by="properties~Priority~number", inplace=True)
-    df = df[df["properties~Obsolet~checkbox"] == False]
-    df = df[df["properties~Completed~date~start"].isna()]
-    df = df[~df["properties~Priority~number"].isna()]
-    df = df[~df["properties~Effort~select~name"].isna()]
-    df = df[df["properties~Status~status~name"] == "Not started"]
-    df = df[df["properties~Project~multi_select"].str.len() != 0]
+    df = df[["id", "title", "properties~Priority~number"]]
+    df = df.sort_values(by="properties~Priority~number")
 
     df.reset_index(drop=True, inplace=True)
     logger.info("filtered & starting to update with id " + database_id)
-    for index, row in df.iterrows():
-        update_priority(df.iloc[index]["id"], index + 1, df.iloc[index]["title"])
-        if (index + 1) % 10 == 0:
-            logger.info(f"updated {index + 1} rows")
-        if (index + 1) % 30 == 0:
-            logger.info(f"updated {index + 1} rows")
-        time.sleep(1)
+    result = update_priorities(df, get_sparse_priorities(df["properties~Priority~number"]))
     logger.info("Done updating database with id " + database_id)
+    return result
 
 def _extract_title(cell):
     if isinstance(cell, list) and len(cell) > 0 and isinstance(cell[0], dict):
@@ -575,14 +679,9 @@ def stretch_databases(database_id, order_field="properties~Priority~number"):
     df.sort_values(by=order_field, inplace=True)
     df.reset_index(drop=True, inplace=True)
     logger.info("filtered & starting to update with id " + database_id)
-    for index, row in df.iterrows():
-        update_priority(df.iloc[index]["id"], index + 1, df.iloc[index]["title"])
-        if (index + 1) % 10 == 0:
-            logger.info(f"updated {index + 1} rows")
-        if (index + 1) % 30 == 0:
-            logger.info(f"updated {index + 1} rows")
-        time.sleep(1)
+    result = update_priorities(df, get_sparse_priorities(df["properties~Priority~number"]))
     logger.info("Done updating database with id " + database_id)
+    return result
 
 
 def fill_freezer_db():
@@ -595,35 +694,29 @@ def fill_freezer_db():
         logger.info("No entries to update in freezer database")
         return
 
-    recipes = get_recipes_from_db()
-    cook_logs = get_cook_log_from_db()
+    recipes = pd.DataFrame.from_dict(get_recipes_from_db(), orient="index")
+    cook_logs = get_latest_cook_log_per_recipe_from_db()
 
-    for index, row in df.iterrows():
-        for _, cook_log in cook_logs.iterrows():
-            notion_recipe_id = row["properties~Tandoor-ID~number"]
-            tandoor_recipe_id = cook_log["recipe_id"]
-
-            if notion_recipe_id != tandoor_recipe_id:
-                continue
+    df = df.assign(recipe_id=df["properties~Tandoor-ID~number"].astype("int64"))
+    df = df.merge(cook_logs[["recipe_id"]], on="recipe_id").join(recipes, on="recipe_id", how="inner")
+    logger.info(f"Found {len(df.index)} cooked recipes for the freezer database")
+    NOTION_CLIENT.run_all(
+        update_freezer_page(row["id"], {"name": row["name"], "link": row["link"]}) for _, row in df.iterrows()
+    )
 
-            cooked_recipe = recipes[tandoor_recipe_id]
-            logger.info(f"Found cooked recipe '{cooked_recipe}' for Tandoor ID {notion_recipe_id}")
 
-            url = BASE_URL + "pages/" + row["id"]
-            data = {
-                "properties": {
-                    "Name / Produkt": {
-                        "title": [{"text": {"content": cooked_recipe["name"]}}]
-                    },
-                    "Rezept-Link": {
-                        "url": cooked_recipe["link"]
-                    }
-                }
-            }
-            r = requests.patch(url, data=json.dumps(data), headers=HEADERS)
-            if r.status_code != 200:
-                logger.error(r.status_code)
-                logger.error(r.text)
-            else:
-                logger.info(f"Updated 'Name / Produkt' for '{cooked_recipe}' ({row['id']})")
-            break
\ No newline at end of file
+async def update_freezer_page(page_id, cooked_recipe):
+    properties = {
+        "Name / Produkt": {
+            "title": [{"text": {"content": cooked_recipe["name"]}}]
+        },
+        "Rezept-Link": {
+            "url": cooked_recipe["link"]
+        }
+    }
+    r = await NOTION_CLIENT.update_page(page_id, properties)
+    if r.status_code != 200:
+        logger.error(r.status_code)
+        logger.error(r.text)
+    else:
+        logger.info(f"Updated 'Name / Produkt' for '{cooked_recipe}' ({page_id})")
\ No newline at end of file
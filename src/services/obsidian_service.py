@@ -15,14 +15,20 @@ if os.name == "nt":
 else:
 	DEBUG = False
 
+MICROJOURNAL_PATH = "0300_Spaces/Microjournal/"
+
 
 def add_to_obsidian_microjournal(list_to_move):
+	now = datetime.now()
+	add_files_to_repository(get_microjournal_files(list_to_move), f"todoist-refresher: {now}", MICROJOURNAL_PATH)
+
+
+def get_microjournal_files(list_to_move):
 	df_items = pd.DataFrame([item.__dict__ for item in list_to_move])
 	df_items["summary"] = get_summaries(df_items.content)
 	df_items["created_at"] = pd.to_datetime(df_items["created_at"]) + pd.Timedelta("01:00:00")
-	now = datetime.now()
 	list_of_files = []
 	for index, row in df_items.iterrows():
 		file = create_file_from_dict(row)
 		list_of_files.append(file)
-	add_files_to_repository(list_of_files, f"todoist-refresher: {now}", "0300_Spaces/Microjournal/")
+	return list_of_files
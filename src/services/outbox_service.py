@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from datetime import datetime
+
+from quarter_lib.logging import setup_logging
+
+from src.helper.outbox import Outbox
+from src.services.github_service import add_files_to_repository, append_to_work_inbox, get_work_inbox_content
+from src.services.notion_service import NOTION_CLIENT, get_task_page_data
+from src.services.obsidian_service import MICROJOURNAL_PATH, get_microjournal_files
+from src.services.todoist_service import SYNC_COMMAND_BATCH_SIZE, get_done_commands, run_todoist_sync_commands
+
+logger = setup_logging(__file__)
+
+DRAIN_INTERVAL = int(os.environ.get("OUTBOX_DRAIN_INTERVAL", 60))
+
+NOTION_PAGE_CREATE = "notion_page_create"
+GITHUB_FILES = "github_files"
+GITHUB_WORK_INBOX = "github_work_inbox"
+TODOIST_COMMAND = "todoist_command"
+
+
+def send_notion_page_creates(payloads):
+	responses = NOTION_CLIENT.run_all(NOTION_CLIENT.create_page(data) for data in payloads)
+	return [None if response.status_code == 200 else f"{response.status_code} {response.text}" for response in responses]
+
+
+def send_github_files(payloads):
+	# all pending file writes go into a single commit
+	list_of_files = [
+		{"filename": payload["subpath"] + file["filename"], "content": file["content"]} for payload in payloads for file in payload["files"]
+	]
+	commit_message = payloads[0]["commit_message"] if len(payloads) == 1 else f"todoist-refresher: {datetime.now()}"
+	add_files_to_repository(list_of_files, commit_message, "")
+	return [None] * len(payloads)
+
+
+def send_work_inbox_contents(payloads):
+	append_to_work_inbox("".join(payload["content"] for payload in payloads), payloads[-1]["run_timestamp"])
+	return [None] * len(payloads)
+
+
+def send_todoist_commands(payloads):
+	response = run_todoist_sync_commands(payloads)
+	if response.status_code != 200:
+		return [f"{response.status_code} {response.text}"] * len(payloads)
+	sync_status = response.json().get("sync_status", {})
+	return [None if sync_status.get(command["uuid"]) == "ok" else str(sync_status.get(command["uuid"])) for command in payloads]
+
+
+OUTBOX = Outbox()
+# registration order is drain order: the Todoist commands depend on the Notion and GitHub writes
+OUTBOX.register(NOTION_PAGE_CREATE, send_notion_page_creates, batch_size=10)
+OUTBOX.register(GITHUB_FILES, send_github_files, batch_size=50)
+OUTBOX.register(GITHUB_WORK_INBOX, send_work_inbox_contents, batch_size=50)
+OUTBOX.register(TODOIST_COMMAND, send_todoist_commands, batch_size=SYNC_COMMAND_BATCH_SIZE)
+
+
+def _get_group_key(sink, item):
+	return f"{sink}:{item.id}"
+
+
+def _get_planning_key(sink, item):
+	# the item's update time makes a re-labelled item a new planning, while a re-plan of an unchanged item
+	# finds the entries of the earlier run
+	return f"{_get_group_key(sink, item)}:{item.updated_at}"
+
+
+def _get_batch_key(sink, items):
+	return f"{sink}:" + hashlib.sha1(",".join(sorted(_get_planning_key(sink, item) for item in items)).encode()).hexdigest()
+
+
+def _get_command_entries(sink, item, commands, depends_on):
+	entries = []
+	for command in commands:
+		command["uuid"] = str(uuid.uuid4())
+		key = f"{_get_planning_key(sink, item)}:{command['type']}"
+		entries.append((TODOIST_COMMAND, key, command, _get_group_key(sink, item), depends_on))
+	return entries
+
+
+def get_unplanned_items(sink, items):
+	"""Items without pending outbox entries; the others are still being handled by an earlier run."""
+	pending_groups = OUTBOX.get_pending_groups(_get_group_key(sink, item) for item in items)
+	skipped = [item for item in items if _get_group_key(sink, item) in pending_groups]
+	if skipped:
+		logger.info(f"{len(skipped)} items of {sink} still have pending outbox entries")
+	return [item for item in items if _get_group_key(sink, item) not in pending_groups]
+
+
+def plan_notion_tasks(sink, database_id, items, label=None, section_id=None, complete=False, priority=None) -> int:
+	"""Queues a Notion page per item and the item's Todoist done commands, which run after the page exists."""
+	queued = 0
+	for item in get_unplanned_items(sink, items):
+		page_key = f"{_get_planning_key(sink, item)}:notion_page"
+		entries = [(NOTION_PAGE_CREATE, page_key, get_task_page_data(database_id, item, priority), _get_group_key(sink, item), None)]
+		entries.extend(_get_command_entries(sink, item, get_done_commands(item, label, section_id, complete), page_key))
+		queued += OUTBOX.add_all(entries) > 0
+	return queued
+
+
+def plan_microjournal(sink, items, label, section_id) -> int:
+	items = get_unplanned_items(sink, items)
+	if not items:
+		return 0
+	files_key = _get_batch_key(sink, items)
+	payload = {
+		"files": get_microjournal_files(items),
+		"subpath": MICROJOURNAL_PATH,
+		"commit_message": f"todoist-refresher: {datetime.now()}",
+	}
+	entries = [(GITHUB_FILES, files_key, payload, None, None)]
+	for item in items:
+		entries.extend(_get_command_entries(sink, item, get_done_commands(item, label, section_id, complete=True), files_key))
+	return len(items) if OUTBOX.add_all(entries) else 0
+
+
+def plan_work_inbox(sink, items, label, section_id) -> int:
+	items = get_unplanned_items(sink, items)
+	if not items:
+		return 0
+	content_key = _get_batch_key(sink, items)
+	run_timestamp = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+	payload = {"content": get_work_inbox_content(items, run_timestamp), "run_timestamp": run_timestamp}
+	entries = [(GITHUB_WORK_INBOX, content_key, payload, None, None)]
+	for item in items:
+		entries.extend(_get_command_entries(sink, item, get_done_commands(item, label, section_id), content_key))
+	return len(items) if OUTBOX.add_all(entries) else 0
+
+
+def drain_outbox() -> dict:
+	return OUTBOX.drain()
+
+
+async def run_outbox_drainer(interval=DRAIN_INTERVAL):
+	while True:
+		try:
+			await asyncio.to_thread(drain_outbox)
+		except Exception as e:
+			logger.error(f"outbox drain failed: {e}")
+		await asyncio.sleep(interval)
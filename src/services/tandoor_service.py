@@ -22,4 +22,13 @@ def get_cook_log_from_db() -> pd.DataFrame:
 	connection = create_postgres_server_connection("tandoor")
 	df = pd.read_sql_query('''SELECT id, recipe_id, "comment" FROM cookbook_cooklog ORDER BY id desc''', connection)
 	close_server_connection(connection)
-	return df
\ No newline at end of file
+	return df
+
+
+def get_latest_cook_log_per_recipe_from_db() -> pd.DataFrame:
+	connection = create_postgres_server_connection("tandoor")
+	df = pd.read_sql_query(
+		'''SELECT DISTINCT ON (recipe_id) id, recipe_id, "comment" FROM cookbook_cooklog ORDER BY recipe_id, id desc''', connection
+	)
+	close_server_connection(connection)
+	return df
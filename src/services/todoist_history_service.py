@@ -1,10 +1,12 @@
-from datetime import datetime
+import json
+from datetime import datetime, timedelta
 
 import pandas as pd
 import requests
 from quarter_lib.logging import setup_logging
 from quarter_lib.todoist import get_sync_url
 
+from src.helper.storage_helper import connect
 from src.helper.web_helper import get_habits_from_web
 from src.services.todoist_service import HEADERS
 
@@ -15,6 +17,27 @@ HABITS = get_habits_from_web()
 habit_list = [x["name"] for x in HABITS]
 
 COMPLETE_TASKS_LIMIT = 200
+ARCHIVE_FILE = "todoist_completed.sqlite3"
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# completed_at only has second precision, so tasks completed shortly before the watermark are fetched again
+WATERMARK_OVERLAP = timedelta(minutes=1)
+# flattened fields stored as real columns, so reports read them without parsing the payloads
+REPORT_COLUMNS = {
+	"item_object_content": "TEXT",
+	"item_object_description": "TEXT",
+	"item_object_priority": "INTEGER",
+	"item_object_completed_at": "TEXT",
+}
+DROPPED_COLUMNS = [
+	"completed_at",
+	"content",
+	"id",
+	"project_id",
+	"section_id",
+	"user_id",
+	"v2_project_id",
+	"v2_section_id",
+]
 
 
 def flatten_dict(d, parent_key="", sep="_"):
@@ -33,60 +56,120 @@ def flatten_dict(d, parent_key="", sep="_"):
 	return dict(items)
 
 
-def flatten_list_of_dicts(lst):
+def _get_archive_state():
+	with connect(ARCHIVE_FILE) as connection:
+		connection.execute(
+			"""CREATE TABLE IF NOT EXISTS completed_tasks (
+				id TEXT PRIMARY KEY,
+				task_id TEXT,
+				project_id TEXT,
+				completed_at TEXT NOT NULL,
+				payload TEXT NOT NULL
+			)"""
+		)
+		existing_columns = {row[1] for row in connection.execute("PRAGMA table_info(completed_tasks)")}
+		for column, column_type in REPORT_COLUMNS.items():
+			if column not in existing_columns:
+				# archives written before the column existed are filled from their payloads once
+				connection.execute(f"ALTER TABLE completed_tasks ADD COLUMN {column} {column_type}")
+				connection.execute(f"UPDATE completed_tasks SET {column} = json_extract(payload, '$.{column}')")
+		connection.execute("CREATE INDEX IF NOT EXISTS completed_tasks_completed_at ON completed_tasks (completed_at)")
+		connection.execute("CREATE TABLE IF NOT EXISTS archive_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+		return dict(connection.execute("SELECT key, value FROM archive_state").fetchall())
+
+
+def _iter_completed_pages(since: str):
+	offset = 0
+	while True:
+		response = requests.post(
+			get_sync_url("completed/get_all"),
+			data={
+				"annotate_notes": True,
+				"annotate_items": True,
+				"since": since,
+				"limit": COMPLETE_TASKS_LIMIT,
+				"offset": offset,
+			},
+			headers=HEADERS,
+			timeout=60,
+		)
+		response.raise_for_status()
+		items = response.json()["items"]
+		yield items
+		if len(items) < COMPLETE_TASKS_LIMIT:
+			break
+		offset += COMPLETE_TASKS_LIMIT
+
+
+def _store_completed_tasks(items) -> str | None:
+	rows = []
+	for item in items:
+		flattened_item = flatten_dict(item)
+		payload = {k: v for k, v in flattened_item.items() if k not in DROPPED_COLUMNS}
+		rows.append(
+			(
+				str(item["id"]),
+				str(item.get("task_id")),
+				str(item.get("project_id")),
+				item["completed_at"][:19],
+				json.dumps(payload),
+				*(payload.get(column) for column in REPORT_COLUMNS),
+			)
+		)
+	columns = ", ".join(["id", "task_id", "project_id", "completed_at", "payload", *REPORT_COLUMNS])
+	with connect(ARCHIVE_FILE) as connection:
+		connection.executemany(
+			f"INSERT OR REPLACE INTO completed_tasks ({columns}) VALUES ({', '.join('?' for _ in range(5 + len(REPORT_COLUMNS)))})", rows
+		)
+	return max((row[3] for row in rows), default=None)
+
+
+def update_completed_tasks_archive(since: datetime) -> int:
 	"""
-	Flatten a list of dictionaries, where one or more dictionaries might contain nested dictionaries.
+	Downloads the tasks completed after the stored watermark into the local archive; if the archive does not
+	reach back to `since` yet, everything since `since` is downloaded. Every page is stored as it arrives.
 	"""
-	flattened_list = []
-	for item in lst:
-		flattened_item = flatten_dict(item)
-		flattened_list.append(flattened_item)
-	return flattened_list
+	state = _get_archive_state()
+	since_string = since.strftime(DATE_FORMAT)
+	coverage_start = state.get("coverage_start")
+	watermark = state.get("watermark")
+	if coverage_start is None or watermark is None or since_string < coverage_start:
+		fetch_since = since_string
+		coverage_start = min(since_string, coverage_start or since_string)
+	else:
+		fetch_since = (datetime.strptime(watermark, DATE_FORMAT) - WATERMARK_OVERLAP).strftime(DATE_FORMAT)
+	count = 0
+	newest = watermark
+	for items in _iter_completed_pages(fetch_since):
+		newest_in_page = _store_completed_tasks(items)
+		if newest_in_page and (newest is None or newest_in_page > newest):
+			newest = newest_in_page
+		count += len(items)
+	with connect(ARCHIVE_FILE) as connection:
+		connection.executemany(
+			"INSERT OR REPLACE INTO archive_state (key, value) VALUES (?, ?)",
+			[("coverage_start", coverage_start), ("watermark", newest or fetch_since)],
+		)
+	logger.info(f"archived {count} completed tasks since {fetch_since}")
+	return count
 
 
 def get_completed_tasks(since: datetime) -> pd.DataFrame:
-	offset = 0
-	all_items = []
+	"""Tasks completed since `since` with the REPORT_COLUMNS, read from the archive after updating it."""
+	since_string = since.strftime(DATE_FORMAT)
 	try:
-		while True:
-			response = requests.post(
-				get_sync_url("completed/get_all"),
-				data={
-					"annotate_notes": True,
-					"annotate_items": True,
-					"since": since.strftime("%Y-%m-%dT%H:%M:%S"),
-					"limit": COMPLETE_TASKS_LIMIT,
-					"offset": offset,
-				},
-				headers=HEADERS,
-			).json()
-
-			all_items.extend(flatten_list_of_dicts(response["items"]))
-			if len(response["items"]) < COMPLETE_TASKS_LIMIT:
-				break
-			offset += COMPLETE_TASKS_LIMIT
+		update_completed_tasks_archive(since)
 	except Exception as e:
-		return pd.DataFrame()
-	all_items = [
-		{
-			k: v
-			for k, v in item.items()
-			if k
-			not in [
-				"completed_at",
-				"content",
-				"id",
-				"project_id",
-				"section_id",
-				"user_id",
-				"v2_project_id",
-				"v2_section_id",
-			]
-		}
-		for item in all_items
-	]
-	# flatten
-	df = pd.DataFrame(all_items)
-	if "item_object_completed_at" in df.columns:
-		df["item_object_completed_at"] = pd.to_datetime(df["item_object_completed_at"])
+		coverage_start = _get_archive_state().get("coverage_start")
+		if coverage_start is None or since_string < coverage_start:
+			logger.error(f"could not download completed tasks since {since_string}: {e}")
+			raise
+		logger.error(f"could not update the completed tasks archive, reading the last archived state: {e}")
+	with connect(ARCHIVE_FILE) as connection:
+		df = pd.read_sql_query(
+			f"SELECT {', '.join(REPORT_COLUMNS)} FROM completed_tasks WHERE completed_at >= ? ORDER BY completed_at",
+			connection,
+			params=(since_string,),
+		)
+	df["item_object_completed_at"] = pd.to_datetime(df["item_object_completed_at"])
 	return df
@@ -1,6 +1,8 @@
+import os
 import uuid
-from datetime import datetime, timedelta, date, time
+from datetime import datetime, timedelta
 
+import numpy as np
 import pandas as pd
 import requests
 from dateutil import parser
@@ -10,21 +12,24 @@ from quarter_lib.todoist import (
 	add_reminder,
 	get_user_state,
 	move_item_to_project,
-	move_item_to_section,
 	update_due,
 	run_sync_commands,
 	create_headers
 )
 from todoist_api_python.api import TodoistAPI
 
-from itertools import chain
+from src.helper.caching import ttl_cache
+from src.helper.todoist_state import TodoistState
 
 logger = setup_logging(__file__)
 DEFAULT_OFFSET = timedelta(hours=2)
+# vacation mode and timezone rarely change, so they are fetched once per TTL and day and shared by all jobs
+USER_STATE_TTL = int(os.environ.get("TODOIST_USER_STATE_TTL", 24 * 60 * 60))
 
 TODOIST_TOKEN = get_secrets(["todoist/token"])
 
 TODOIST_API = TodoistAPI(TODOIST_TOKEN)
+TODOIST_STATE = TodoistState(TODOIST_TOKEN)
 HEADERS = create_headers(token=TODOIST_TOKEN)
 
 PROJECT_LIST = [
@@ -39,14 +44,6 @@ DAILY_SECTION_ID = "63g8vW6fXwhQP3Vx"
 THIS_WEEK_PROJECT_ID = "6Crcr3mXxVh6f97J"
 NEXT_WEEK_PROJECT_ID = "6Crcr3mXxj9c98w6"
 
-PROJECT_DICT = {
-	"THIS WEEK": [],
-	"NEXT WEEK": [],
-	"IN 3-4 WEEKS": [],
-	"IN 5-8 WEEKS": [],
-	"LONG-TERM | ON HOLD": [],
-}
-
 TO_TPT_DONE_LABEL_NAME = "To-TPT-Done"
 TPT_DONE_SECTION_ID = "66p5R3PWgVJ4QmmJ"
 
@@ -58,96 +55,163 @@ MICROJOURNAL_DONE_SECTION_ID = "66p5f4GRVmxXFr2J"
 TO_WORK_DONE_LABEL_NAME = "To-Work-Done"
 TO_WORK_DONE_SECTION_ID = "69MhcF3pw3mJcrgr"
 
+DONE_LABELS = {
+	"TPT": TO_TPT_DONE_LABEL_NAME,
+	"MM": TO_MM_DONE_LABEL_ID,
+	"Work": TO_WORK_DONE_LABEL_NAME,
+	"Microjournal": TO_MICROJOURNAL_DONE_LABEL_NAME,
+}
+# the Sync API accepts up to 100 commands per request
+SYNC_COMMAND_BATCH_SIZE = 100
 
-OBSIDIAN_REWORK_PROJECT_ID = "6RRHRWmrQCvCVjJv"
 
-def get_from_iterable(iterable):
-	return list(chain.from_iterable(iterable))
+OBSIDIAN_REWORK_PROJECT_ID = "6RRHRWmrQCvCVjJv"
 
 
 def get_projects():
-	projects = get_from_iterable(TODOIST_API.get_projects())
+	TODOIST_STATE.sync()
+	projects = TODOIST_STATE.get_projects()
 	df_projects = pd.DataFrame(projects)
 	df_projects = df_projects[df_projects.name.isin(PROJECT_LIST)]
 	return df_projects
 
 
+@ttl_cache(ttl=USER_STATE_TTL, per_day=True)
+def get_tz_info():
+	return get_user_state()
+
+
 def get_default_offset():
-	tz_info = get_user_state()
+	tz_info = get_tz_info()
 	delta = timedelta(hours=tz_info["hours"], minutes=tz_info["minutes"])
 	return delta, tz_info["gmt_string"]
 
 
 
 
-def get_data():
-	df_projects = pd.DataFrame(item.__dict__ for item in get_from_iterable(TODOIST_API.get_projects()))
-
-	selected_project_ids = df_projects[df_projects.name.isin(PROJECT_LIST)].id.tolist()
+ITEM_COLUMNS = {
+	"id": "object",
+	"content": "object",
+	"description": "object",
+	"project_id": "object",
+	"section_id": "object",
+	"parent_id": "object",
+	"labels": "object",
+	"priority": "Int64",
+	"due_date": "object",
+	"due_string": "object",
+	"is_recurring": "bool",
+	"added_at": "object",
+}
 
-	item_list = []
-	for project_id in selected_project_ids:
-		items = get_from_iterable(TODOIST_API.get_tasks(project_id=project_id))
-		item_list.extend(items)
-	df_items = pd.DataFrame(item.__dict__ for item in item_list)
 
+def get_items_frame(items) -> pd.DataFrame:
+	"""Typed DataFrame of raw Sync API items; the due object is flattened to due_date, due_string and is_recurring."""
+	rows = []
+	for item in items:
+		due = item.get("due") or {}
+		rows.append(
+			(
+				item["id"],
+				item.get("content"),
+				item.get("description"),
+				item.get("project_id"),
+				item.get("section_id"),
+				item.get("parent_id"),
+				item.get("labels") or [],
+				item.get("priority"),
+				due.get("date"),
+				due.get("string"),
+				bool(due.get("is_recurring")),
+				item.get("added_at"),
+			)
+		)
+	return pd.DataFrame.from_records(rows, columns=list(ITEM_COLUMNS)).astype(ITEM_COLUMNS)
 
-	df_projects = df_projects[df_projects.name.isin(PROJECT_LIST)]
-	df_items_due = df_items.loc[~df_items.due.isna()]
-	df_items_due = df_items_due.loc[df_items_due.project_id.isin(df_projects.id)]
 
-	df_items_no_due = df_items.loc[df_items.due.isna()]
-	df_items_next_week = df_items_no_due[df_items_no_due.project_id == NEXT_WEEK_PROJECT_ID]
+def get_data():
+	TODOIST_STATE.sync()
+	df_projects = pd.DataFrame(
+		[(project["id"], project["name"]) for project in TODOIST_STATE.get_raw_projects() if project["name"] in PROJECT_LIST],
+		columns=["id", "name"],
+	)
 
-	return df_items_due, df_projects, df_items_next_week
+	items = []
+	for project_id in df_projects.id:
+		items.extend(TODOIST_STATE.get_raw_items(project_id=project_id))
+	df_items = get_items_frame(items)
 
+	has_due = df_items.due_date.notna()
+	df_items_due = df_items.loc[has_due]
+	df_items_next_week = df_items.loc[~has_due & (df_items.project_id == NEXT_WEEK_PROJECT_ID)]
 
-def check_due(task_id, due, project_id, week_list, df_projects, project_dict):
-	# check if year is the same
-	# check if due is Datetime
-	if isinstance(due.date, datetime):
-		due_date = due.date
-	elif isinstance(due.date, date):
-		due_date = datetime.combine(due.date, time())
-	else:
-		due_date = parser.parse(due.date)
+	return df_items_due, df_projects, df_items_next_week
 
-	# check if due_date is in past
-	if due_date <= datetime.today():
-		return check_and_add(project_id, task_id, 0, df_projects, project_dict)
 
-	if due_date.year == datetime.today().year:
-		due_date_week = due_date.isocalendar()[1]
-		if (
-			week_list[0] == due_date_week or week_list[0] - 1 == due_date_week
-		):  # second condition because tasks on sunday or day at execution
-			return check_and_add(project_id, task_id, 0, df_projects, project_dict)
-		if week_list[1] == due_date_week:
-			return check_and_add(project_id, task_id, 1, df_projects, project_dict)
-		if week_list[2] <= due_date_week <= week_list[2] + 1:
-			return check_and_add(project_id, task_id, 2, df_projects, project_dict)
-		if week_list[3] <= due_date_week <= week_list[3] + 3:
-			return check_and_add(project_id, task_id, 3, df_projects, project_dict)
-	check_and_add(project_id, task_id, 4, df_projects, project_dict)
-	return None
+def parse_due_dates(due_dates: pd.Series) -> pd.Series:
+	"""Parses Todoist due dates to naive local datetimes; dates with a timezone are converted to local time."""
+	due_dates = due_dates.astype("string")
+	has_timezone = due_dates.str.contains(r"(?:Z|[+-]\d{2}:\d{2})$", regex=True, na=False)
+	parsed = pd.Series(pd.NaT, index=due_dates.index, dtype="datetime64[ns]")
+	if (~has_timezone).any():
+		parsed[~has_timezone] = pd.to_datetime(due_dates[~has_timezone], format="ISO8601", errors="coerce")
+	if has_timezone.any():
+		local_timezone = datetime.now().astimezone().tzinfo
+		parsed[has_timezone] = (
+			pd.to_datetime(due_dates[has_timezone], format="ISO8601", utc=True, errors="coerce")
+			.dt.tz_convert(local_timezone)
+			.dt.tz_localize(None)
+		)
+	return parsed
+
+
+def get_week_buckets(due_dates: pd.Series, week_list, now=None) -> np.ndarray:
+	"""Index into PROJECT_LIST for every due date, computed for all dates at once."""
+	now = now or datetime.today()
+	due_dates = parse_due_dates(due_dates)
+	week = due_dates.dt.isocalendar().week.astype("Int64").fillna(-1).to_numpy(dtype=int)
+	same_year = (due_dates.dt.year == now.year).to_numpy()
+	conditions = [
+		(due_dates <= now).to_numpy(),
+		# second condition because tasks on sunday or day at execution
+		same_year & ((week == week_list[0]) | (week == week_list[0] - 1)),
+		same_year & (week == week_list[1]),
+		same_year & (week >= week_list[2]) & (week <= week_list[2] + 1),
+		same_year & (week >= week_list[3]) & (week <= week_list[3] + 3),
+	]
+	return np.select(conditions, [0, 0, 1, 2, 3], default=len(PROJECT_LIST) - 1)
 
 
-def check_and_add(project_id, task_id, index, df_projects, project_dict):
-	new_project = df_projects[df_projects.name == PROJECT_LIST[index]].iloc[0]
-	if project_id != new_project.id:
-		project_dict[PROJECT_LIST[index]].append(task_id)
+def get_project_ids(df_projects) -> dict:
+	return df_projects.drop_duplicates("name").set_index("name").id.to_dict()
 
 
-def check_next_week(task_id, project_id, df_projects, project_dict):
-	check_and_add(project_id, task_id, 0, df_projects, project_dict)
+def plan_project_moves(df_items_due, df_items_next_week, project_ids, week_list, now=None) -> pd.DataFrame:
+	"""Tasks (id, project_id, target_project_id) which are not in the project of their week bucket yet."""
+	target_ids = np.array([project_ids[project_name] for project_name in PROJECT_LIST], dtype=object)
+	due_moves = pd.DataFrame(
+		{
+			"id": df_items_due.id.to_numpy(),
+			"project_id": df_items_due.project_id.to_numpy(),
+			"target_project_id": target_ids[get_week_buckets(df_items_due.due_date, week_list, now)],
+		}
+	)
+	next_week_moves = pd.DataFrame(
+		{
+			"id": df_items_next_week.id.to_numpy(),
+			"project_id": df_items_next_week.project_id.to_numpy(),
+			"target_project_id": target_ids[0],
+		}
+	)
+	moves = pd.concat([due_moves, next_week_moves], ignore_index=True).drop_duplicates("id")
+	return moves[moves.project_id != moves.target_project_id]
 
 
-def move_items(project_dict, df_projects):
-	for project in project_dict.keys():
-		for task_id in project_dict[project]:
-			project_to_move = df_projects[df_projects.name == project].iloc[0]
-			result = TODOIST_API.move_task(task_id=task_id, project_id=project_to_move["id"])
-			logger.info(f"trying to move task {task_id} to project {project} - result: {result}")
+def get_move_commands(moves) -> list:
+	return [
+		{"type": "item_move", "args": {"id": task_id, "project_id": project_id}}
+		for task_id, project_id in zip(moves.id, moves.target_project_id)
+	]
 
 
 def get_timestamps():
@@ -229,54 +293,73 @@ def get_description(activities, calendar_description=None):
 	return description_string
 
 
+@ttl_cache(ttl=USER_STATE_TTL, per_day=True)
 def get_vacation_mode() -> bool:
 	user_response = requests.get(
 		"https://api.todoist.com/api/v1/tasks/completed/stats", headers=HEADERS)
+	user_response.raise_for_status()
 	goals = user_response.json().get("goals", {})
 	vacation_mode = bool(goals.get("vacation_mode", False))
 	return vacation_mode
 
-def get_items_by_todoist_label(label_name):
-	return get_from_iterable(TODOIST_API.get_tasks(label=label_name))
-
-
-def complete_task(item):
-	TODOIST_API.complete_task(task_id=item.id)
 
+def clear_user_state_cache():
+	get_vacation_mode.cache_clear()
+	get_tz_info.cache_clear()
 
-def move_item_to_notion_done(item):
-	TODOIST_API.move_task(task_id=item.id, section_id=TPT_DONE_SECTION_ID)
 
-
-def set_done_label(item, label):
-	if label == "TPT":
-		TODOIST_API.update_task(task_id=item.id, labels=[TO_TPT_DONE_LABEL_NAME])
-	elif label == "MM":
-		TODOIST_API.update_task(task_id=item.id, labels=[TO_MM_DONE_LABEL_ID])
-	elif label == "Work":
-		TODOIST_API.update_task(task_id=item.id, labels=[TO_WORK_DONE_LABEL_NAME])
-	elif label == "Microjournal":
-		TODOIST_API.update_task(task_id=item.id, labels=[TO_MICROJOURNAL_DONE_LABEL_NAME])
-	else:
-		logger.error("set-done label not found")
+def get_items_by_todoist_label(label_name):
+	TODOIST_STATE.sync()
+	return TODOIST_STATE.get_items(label=label_name)
 
 
-def move_item_to_work_done(item):
-	move_item_to_section(item.id, section_id=TO_WORK_DONE_SECTION_ID)
+def get_items_by_todoist_labels(label_names) -> dict:
+	"""Items per label, all served from a single sync."""
+	TODOIST_STATE.sync()
+	return {label_name: TODOIST_STATE.get_items(label=label_name) for label_name in label_names}
 
 
-def move_item_to_microjournal_done(item):
-	move_item_to_section(item.id, section_id=MICROJOURNAL_DONE_SECTION_ID)
+def get_done_commands(item, label=None, section_id=None, complete=False):
+	"""Sync API commands which move a routed item to its done section, set its done label and complete it."""
+	commands = []
+	if section_id:
+		commands.append({"type": "item_move", "args": {"id": item.id, "section_id": section_id}})
+	if label:
+		if label in DONE_LABELS:
+			commands.append({"type": "item_update", "args": {"id": item.id, "labels": [DONE_LABELS[label]]}})
+		else:
+			logger.error("set-done label not found")
+	if complete:
+		commands.append({"type": "item_close", "args": {"id": item.id}})
+	return commands
 
 
 def run_todoist_sync_commands(commands):
 	for command in commands:
-		command["uuid"] = str(uuid.uuid4())
+		command.setdefault("uuid", str(uuid.uuid4()))
 		if not command.get("temp_id"):
 			command["temp_id"] = str(uuid.uuid4())
 	return run_sync_commands(commands)
 
 
+def run_todoist_sync_command_batches(commands) -> dict:
+	"""Sends the commands in batches of up to 100 and returns the sync_status of every command by uuid."""
+	sync_status = {}
+	for i in range(0, len(commands), SYNC_COMMAND_BATCH_SIZE):
+		batch = commands[i : i + SYNC_COMMAND_BATCH_SIZE]
+		response = run_todoist_sync_commands(batch)
+		if response.status_code != 200:
+			logger.error(f"sync batch of {len(batch)} commands failed: {response.status_code} {response.text}")
+			sync_status.update({command["uuid"]: response.text for command in batch})
+			continue
+		sync_status.update(response.json().get("sync_status", {}))
+	for command in commands:
+		status = sync_status.get(command["uuid"])
+		if status != "ok":
+			logger.error(f"sync command {command['type']} for {command['args'].get('id')} failed: {status}")
+	return sync_status
+
+
 def add_after_vacation_tasks():
 	after_vacation_tasks = ["Monica mit Erblebnissen aus Urlaub pflegen", ""]
 	[add_item_and_reminder(task_content, "2244725398", {"string": "tomorrow"}) for task_content in after_vacation_tasks]
@@ -288,7 +371,13 @@ def add_item_and_reminder(content, project_id, due):
 
 
 def get_items_by_todoist_project(project_id):
-	return get_from_iterable(TODOIST_API.get_tasks(project_id=project_id))
+	TODOIST_STATE.sync()
+	return TODOIST_STATE.get_items(project_id=project_id)
+
+
+def get_item_counts_by_todoist_project(project_ids) -> list[int]:
+	"""Number of open items per project, counted from the project index of the last sync."""
+	return [TODOIST_STATE.count_items(project_id) for project_id in project_ids]
 
 
 def update_task_due(item, due:str):
@@ -336,7 +425,8 @@ def add_todoist_task(*args, **kwargs):
 
 
 def get_rework_projects():
-	projects = get_from_iterable(TODOIST_API.get_projects())
+	TODOIST_STATE.sync()
+	projects = TODOIST_STATE.get_projects()
 	rework_projects = []
 	for project in projects:
 		if project.name.startswith("Book-Rework"):
@@ -348,6 +438,7 @@ check_string = "- [Link](https://cubox.cc"
 
 
 def get_cubox_rework_items() -> list:
-	tasks = get_from_iterable(TODOIST_API.get_tasks(project_id=THIS_WEEK_PROJECT_ID))
+	TODOIST_STATE.sync()
+	tasks = TODOIST_STATE.get_items(project_id=THIS_WEEK_PROJECT_ID)
 	filtered_tasks = [task for task in tasks if check_string in task.content]
 	return filtered_tasks